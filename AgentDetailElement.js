@@ -64,27 +64,78 @@ function AgentDetailElement() {
 AgentDetailElement.prototype = Object.create(VisualizationElement.prototype);
 AgentDetailElement.prototype.constructor = AgentDetailElement;
 
-// Called every step; receives data from the Python model.
+// Frames between refetches of the selected agent while only its vitals change; a change
+// of its state, vaccination or death in the frame deltas triggers a refetch right away.
+AgentDetailElement.VITALS_REFRESH_FRAMES = 5;
+
+// Called every step; receives only the agents whose state changed since the last frame
+// ({reset, step, agents}). The deltas keep agentData ({id: {state, vaccinated, dead}})
+// current, which decides when the full record of the selected agent is fetched again.
 AgentDetailElement.prototype.render = function(data) {
-    this.agentData = data;
+    var selectedChanged = false;
+    if (data.reset || !this.agentData) {
+        this.agentData = {};
+        selectedChanged = true;
+    }
+    for (var id in data.agents) {
+        if (data.agents.hasOwnProperty(id)) {
+            this.agentData[id] = Object.assign(this.agentData[id] || {}, data.agents[id]);
+            selectedChanged = selectedChanged || id === this.selectedID;
+        }
+    }
+    this.framesSinceFetch = (this.framesSinceFetch || 0) + 1;
     //console.log("AgentDetailElement render called. Data:", data);
     
     var placeholder = document.getElementById("agent-detail-placeholder");
     if (placeholder) {
         placeholder.innerHTML = "";  // Clear old content
         placeholder.appendChild(this.container);
-    } else {
+    } else if (!this.container.parentNode) {
         console.warn("Placeholder not found. Appending to document.body instead.");
         document.body.appendChild(this.container);
     }
+
+    // Keep the panel of the searched agent up to date; dead agents' vitals no longer change
+    if (this.selectedID !== undefined && this.selectedID !== "") {
+        var entry = this.agentData[this.selectedID];
+        if (selectedChanged || (entry && !entry.dead
+                                && this.framesSinceFetch >= AgentDetailElement.VITALS_REFRESH_FRAMES)) {
+            this.displayAgentDetails(this.selectedID);
+        }
+    }
     
     // Return the container's outerHTML for Mesa's update pipeline.
     return this.container.outerHTML;
 };
 
-// Function to display details for a given agent ID.
+// Static URL of the body images, served next to this file by ModularServer.
+AgentDetailElement.IMAGE_ROOT = "/local/AgentDetailElement/";
+
+// Fetch the full record of an agent from the server and display it.
 AgentDetailElement.prototype.displayAgentDetails = function(agentID) {
-    var details = this.agentData[agentID];
+    var self = this;
+    this.selectedID = String(agentID).trim();
+    agentID = this.selectedID;
+    this.framesSinceFetch = 0;
+    // Agents the deltas never mentioned do not exist, so there is nothing to fetch
+    if (this.agentData && !this.agentData.hasOwnProperty(agentID)) {
+        this.pendingRequest = null;
+        this.showAgentDetails(agentID, null);
+        return;
+    }
+    var request = this.pendingRequest = fetch("/agent/" + encodeURIComponent(agentID))
+        .then(function(response) { return response.ok ? response.json() : null; })
+        .catch(function() { return null; })
+        .then(function(details) {
+            // Ignore answers that were overtaken by a newer request
+            if (request === self.pendingRequest) {
+                self.showAgentDetails(agentID, details);
+            }
+        });
+};
+
+// Function to display details for a given agent ID.
+AgentDetailElement.prototype.showAgentDetails = function(agentID, details) {
     if (details) {
         // Clear existing content
         this.detailsDiv.innerHTML = "";
@@ -94,7 +145,7 @@ AgentDetailElement.prototype.displayAgentDetails = function(agentID) {
         let healthValues = {};  // Store health values for coloring logic
         
         for (var key in details) {
-            if (details.hasOwnProperty(key) && key !== "human" && key !== "lungs" && key !== "heart" && key !== "artery") {
+            if (details.hasOwnProperty(key) && key !== "health history") {
                 var li = document.createElement("li");
 
                 // Check if the detail is an array (e.g., health history or current health)
@@ -147,7 +198,7 @@ AgentDetailElement.prototype.displayAgentDetails = function(agentID) {
         imageContainer.style.height = "700px"; // Adjust height accordingly
         imageContainer.style.margin = "20px auto"; // Center align
 
-        function createImageElement(base64Data, altText, width, height, left, top, zIndex, glowColor) {
+        function createImageElement(imageURL, altText, width, height, left, top, zIndex, glowColor) {
             let wrapper = document.createElement("div");
             wrapper.style.position = "absolute";
             wrapper.style.left = left + "px";
@@ -170,7 +221,7 @@ AgentDetailElement.prototype.displayAgentDetails = function(agentID) {
 
             // Create the actual image
             let img = new Image();
-            img.src = "data:image/png;base64," + base64Data;
+            img.src = imageURL;
             img.alt = altText;
             img.width = width;
             img.height = height;
@@ -183,7 +234,7 @@ AgentDetailElement.prototype.displayAgentDetails = function(agentID) {
             return wrapper;
         }
 
-        function createArteryElement(base64Data, altText, width, height, left, top, zIndex, glowColor) {
+        function createArteryElement(imageURL, altText, width, height, left, top, zIndex, glowColor) {
             let wrapper = document.createElement("div");
             wrapper.style.position = "absolute";
             wrapper.style.left = left + "px";
@@ -242,7 +293,7 @@ AgentDetailElement.prototype.displayAgentDetails = function(agentID) {
         
             // Create the actual image
             let img = new Image();
-            img.src = "data:image/png;base64," + base64Data;
+            img.src = imageURL;
             img.alt = altText;
             img.width = width;
             img.height = height;
@@ -255,22 +306,15 @@ AgentDetailElement.prototype.displayAgentDetails = function(agentID) {
         }
 
         // Append images with proper positioning
-        if (details.human) {
-            let humanImg = createImageElement(details.human, "Human Body", 250, 700, 0, 0,1, tempColor);
-            imageContainer.appendChild(humanImg);
-        }
-        if (details.lungs) {
-            let lungsImg = createImageElement(details.lungs, "Lungs", 130, 130, 60, 120, 3, rrColor); // Adjust left and top to align
-            imageContainer.appendChild(lungsImg);
-        }
-        if (details.heart) {
-            let heartImg = createImageElement(details.heart, "Heart", 70, 70, 110, 150, 4, hrColor); // Position heart in center
-            imageContainer.appendChild(heartImg);
-        }
-        if (details.artery) {
-            let humanImg = createArteryElement(details.artery, "Artery", 250, 600, -10, 110,2, sbpColor);
-            imageContainer.appendChild(humanImg);
-        }
+        var root = AgentDetailElement.IMAGE_ROOT;
+        let humanImg = createImageElement(root + "human.png", "Human Body", 250, 700, 0, 0,1, tempColor);
+        imageContainer.appendChild(humanImg);
+        let lungsImg = createImageElement(root + "lungs.png", "Lungs", 130, 130, 60, 120, 3, rrColor); // Adjust left and top to align
+        imageContainer.appendChild(lungsImg);
+        let heartImg = createImageElement(root + "heart.png", "Heart", 70, 70, 110, 150, 4, hrColor); // Position heart in center
+        imageContainer.appendChild(heartImg);
+        let arteryImg = createArteryElement(root + "artery.png", "Artery", 250, 600, -10, 110,2, sbpColor);
+        imageContainer.appendChild(arteryImg);
 
         this.detailsDiv.appendChild(imageContainer);
     } else {
@@ -286,6 +330,9 @@ AgentDetailElement.prototype.reset = function() {
     //console.log("Resetting AgentDetailElement");
     this.detailsDiv.innerHTML = "";
     this.searchBar.value = "";
+    this.selectedID = undefined;
+    this.pendingRequest = null;
+    this.agentData = {};
 };
 
 window.AgentDetailElement = AgentDetailElement;
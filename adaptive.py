@@ -0,0 +1,177 @@
+"""Adaptive-fidelity health updates: skip the health model for stable agents.
+
+An agent is stable when its newly sampled state equals its previous state and none of
+its last `window` vitals steps moved by more than `tolerance` (in the units of each
+vital). Stable agents are advanced by a damped linear extrapolation of their last two
+vitals instead of a health_time_series_model prediction. Every agent still gets a
+full prediction at least every `refresh_every` steps.
+
+A random `audit_fraction` of the stable agents is predicted in full anyway and
+compared with the extrapolation. When the running mean absolute error of those audits
+exceeds `error_budget`, the tolerance is halved; while it stays below half the budget,
+the tolerance grows back towards its configured value.
+
+    adaptive = AdaptiveFidelity(tolerance=0.5, refresh_every=10, error_budget=0.5)
+    model = PandemicModel(40, 40, 800, backend="numpy", adaptive=adaptive)
+    ...
+    print(adaptive.report())
+
+fidelity_report() runs a scenario twice with the same seed, with and without the
+adaptive mode, and reports the skip rate and how far the two runs drift apart.
+"""
+import argparse
+
+import numpy as np
+
+from inference import ENGINES
+
+
+class AdaptiveFidelity:
+    """Decides per step which agents get full health-model inference, and keeps statistics."""
+
+    def __init__(self, tolerance=0.5, window=3, refresh_every=10, error_budget=0.5, audit_fraction=0.05,
+                 damping=0.5, seed=None):
+        self.max_tolerance = tolerance
+        self.tolerance = tolerance
+        self.window = window
+        self.refresh_every = refresh_every
+        self.error_budget = error_budget
+        self.audit_fraction = audit_fraction
+        self.damping = damping
+        self.rng = np.random.default_rng(seed)  # audit sampling only, so model streams are unaffected
+        self.last_refresh = np.zeros(0, dtype=np.int64)
+        self.audit_error = None  # running mean absolute error of audited extrapolations
+        self.rows = 0
+        self.skipped = 0
+        self.audited = 0
+        self.audit_error_sum = np.zeros(4)
+
+    def predict_vitals(self, engine, seq, states, rows, changed, step):
+        """Next vitals of rows: engine predictions for unstable agents, extrapolations for the rest.
+
+        seq and states are the health-model inputs of rows, changed marks agents whose
+        sampled state differs from their previous one, and step is the model step.
+        """
+        self._reserve(rows[-1] + 1)
+        n = len(rows)
+        stable = ~changed & (step - self.last_refresh[rows] < self.refresh_every)
+        if seq.shape[1] > self.window:
+            recent = seq[:, -self.window - 1:]
+            stable &= np.abs(np.diff(recent, axis=1)).max(axis=(1, 2)) <= self.tolerance
+        else:
+            stable[:] = False
+        audit = stable & (self.rng.random(n) < self.audit_fraction)
+        full = ~stable | audit
+
+        predicted = np.empty((n, seq.shape[2]), dtype=np.float32)
+        if full.all():
+            predicted[:] = engine.predict_vitals(seq, states)
+        elif full.any():
+            predicted[full] = engine.predict_vitals(seq[full], states[full])
+        extrapolated = seq[stable, -1] + self.damping * (seq[stable, -1] - seq[stable, -2])
+        skip = ~audit[stable]
+        predicted[stable & ~audit] = extrapolated[skip]
+        self.last_refresh[rows[full]] = step
+
+        if audit.any():
+            errors = np.abs(extrapolated[~skip] - predicted[audit])
+            self.audit_error_sum += errors.sum(axis=0)
+            self.audited += len(errors)
+            self._adjust_tolerance(errors.mean())
+        self.rows += n
+        self.skipped += int(skip.sum())
+        return predicted
+
+    def move_rows(self, moved_from, moved_to):
+        """Follow agents moved to other rows of the population (see PopulationStore.remove)."""
+        self._reserve(moved_from.max(initial=-1) + 1)
+        self.last_refresh[moved_to] = self.last_refresh[moved_from]
+
+    def forget_rows(self, rows):
+        """Rows taken by new agents, which get a full prediction next time."""
+        self._reserve(rows.max(initial=-1) + 1)
+        self.last_refresh[rows] = -self.refresh_every
+
+    def _reserve(self, n):
+        if len(self.last_refresh) < n:
+            grown = np.full(n, -self.refresh_every, dtype=np.int64)
+            grown[:len(self.last_refresh)] = self.last_refresh
+            self.last_refresh = grown
+
+    def _adjust_tolerance(self, error):
+        self.audit_error = error if self.audit_error is None else 0.8 * self.audit_error + 0.2 * error
+        if self.audit_error > self.error_budget:
+            self.tolerance /= 2
+        elif self.audit_error < self.error_budget / 2:
+            self.tolerance = min(self.tolerance * 1.25, self.max_tolerance)
+
+    def report(self):
+        return {
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "skip_rate": self.skipped / self.rows if self.rows else 0.0,
+            "audited": self.audited,
+            "audit_mean_abs_error": (self.audit_error_sum / self.audited).tolist() if self.audited else None,
+            "audit_error": self.audit_error,
+            "error_budget": self.error_budget,
+            "tolerance": self.tolerance,
+        }
+
+
+def fidelity_report(config, steps, **adaptive_args):
+    """Run config (a batch_runner scenario) with full and adaptive fidelity and compare.
+
+    Both runs use the same seed, so they only drift apart through the extrapolated vitals.
+    Returns the adaptive report plus, per step, the mean absolute difference of the
+    latest vitals of agents alive in both runs and the largest reporter difference.
+    """
+    from batch_runner import build_model
+
+    config = dict(config)
+    config.setdefault("seed", 0)
+    adaptive = AdaptiveFidelity(**adaptive_args)
+    full_model = build_model(config)
+    adaptive_model = build_model(config, adaptive=adaptive)
+    vitals_drift = []
+    for _ in range(steps):
+        full_model.step()
+        adaptive_model.step()
+        alive = ~(full_model.population.dead[:full_model.population.size]
+                  | adaptive_model.population.dead[:adaptive_model.population.size])
+        difference = np.abs(full_model.population.latest()[alive] - adaptive_model.population.latest()[alive])
+        vitals_drift.append(difference.mean(axis=0).tolist() if alive.any() else [0.0] * 4)
+
+    full_series = full_model.datacollector.get_model_vars_dataframe()
+    adaptive_series = adaptive_model.datacollector.get_model_vars_dataframe()
+    report = adaptive.report()
+    report["vitals_drift"] = vitals_drift
+    report["max_reporter_difference"] = (adaptive_series - full_series).abs().max().to_dict()
+    return report
+
+
+def main(argv=None):
+    from batch_runner import DEFAULT_SCENARIO
+
+    parser = argparse.ArgumentParser(description="Compare adaptive-fidelity runs with full-fidelity runs.")
+    parser.add_argument("--width", type=int, default=DEFAULT_SCENARIO["width"])
+    parser.add_argument("--height", type=int, default=DEFAULT_SCENARIO["height"])
+    parser.add_argument("--N", type=int, default=DEFAULT_SCENARIO["N"])
+    parser.add_argument("--steps", type=int, default=50)
+    parser.add_argument("--backend", choices=sorted(ENGINES), default="numpy")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--refresh-every", type=int, default=10, dest="refresh_every")
+    parser.add_argument("--error-budget", type=float, default=0.5, dest="error_budget")
+    args = parser.parse_args(argv)
+
+    config = {"width": args.width, "height": args.height, "N": args.N, "backend": args.backend, "seed": args.seed}
+    report = fidelity_report(config, args.steps, tolerance=args.tolerance, refresh_every=args.refresh_every,
+                             error_budget=args.error_budget)
+    drift = np.array(report.pop("vitals_drift"))
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    print(f"final vitals drift: {drift[-1].round(3).tolist()}, max: {drift.max(axis=0).round(3).tolist()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Headless runner for PandemicModel.
+
+Runs one or more scenarios without the Mesa web server and writes the
+DataCollector output of each run to CSV.
+
+    python batch_runner.py scenarios.json --out results/
+    python batch_runner.py --N 200 --steps 50 --out results/
+
+A scenario file holds either a single object or a list of objects, e.g.
+{"name": "baseline", "width": 20, "height": 20, "N": 30, "num_hospitals": 3, "steps": 100}
+Any PandemicModel argument in MODEL_PARAMS may be set, e.g. "vaccine_penalty": 2.0.
+"""
+import argparse
+import json
+import os
+import time
+
+from pandemic_model import PandemicModel
+from inference import ENGINES
+from eventlog import EventLog
+from trajectory import TrajectoryRecorder
+
+DEFAULT_SCENARIO = {"name": "default", "width": 20, "height": 20, "N": 30, "num_hospitals": 3, "steps": 100}
+
+# Keys of a scenario config that are passed straight to PandemicModel.
+MODEL_PARAMS = ("width", "height", "N", "num_hospitals", "backend", "seed", "vaccine_penalty",
+                "infected_neighbor_bonus", "batched_moves")
+
+
+def load_scenarios(path):
+    with open(path) as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = [data]
+    scenarios = []
+    for i, config in enumerate(data):
+        scenario = dict(DEFAULT_SCENARIO)
+        scenario["name"] = f"scenario_{i}"
+        scenario.update(config)
+        scenarios.append(scenario)
+    return scenarios
+
+
+def build_model(config, **overrides):
+    """Build a PandemicModel from a scenario config dict."""
+    params = {key: config[key] for key in MODEL_PARAMS if key in config}
+    params.update(overrides)
+    return PandemicModel(**params)
+
+
+def run_scenario(config, steps=None, out_dir=None, trajectory=False, profile=False, events=False, record=False):
+    """Run a scenario headless and return the finished model.
+
+    If out_dir is given the model-level DataCollector series is written to
+    <out_dir>/<name>.csv, with trajectory=True the per-agent trajectory is
+    recorded to <out_dir>/<name>-trajectory/, with profile=True the step
+    phase timings are written to <out_dir>/<name>-profile.json and .prom,
+    with events=True the event log is written to <out_dir>/<name>-events/, and
+    with record=True the web UI frames are recorded to <out_dir>/<name>-playback/
+    for playback.py.
+    """
+    scenario = dict(DEFAULT_SCENARIO)
+    scenario.update(config)
+    steps = scenario["steps"] if steps is None else steps
+
+    recorder = None
+    if trajectory and out_dir is not None:
+        recorder = TrajectoryRecorder(os.path.join(out_dir, f"{scenario['name']}-trajectory"))
+    event_log = None
+    if events and out_dir is not None:
+        event_log = EventLog(os.path.join(out_dir, f"{scenario['name']}-events"))
+    model = build_model(scenario, recorder=recorder, profile=profile, event_log=event_log)
+    playback = None
+    if record and out_dir is not None:
+        # The recorder renders with the web UI elements, so only recording runs import them.
+        from playback import RunRecorder
+        playback = RunRecorder(os.path.join(out_dir, f"{scenario['name']}-playback"))
+        playback.record(model)
+    for _ in range(steps):
+        model.step()
+        if playback is not None:
+            playback.record(model)
+    if recorder is not None:
+        recorder.close()
+    if playback is not None:
+        playback.close()
+    if event_log is not None:
+        event_log.close()
+
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+        results = model.datacollector.get_model_vars_dataframe()
+        results.index.name = "step"
+        results.to_csv(os.path.join(out_dir, f"{scenario['name']}.csv"))
+        if profile:
+            with open(os.path.join(out_dir, f"{scenario['name']}-profile.json"), "w") as f:
+                f.write(model.profiler.to_json(indent=1))
+            with open(os.path.join(out_dir, f"{scenario['name']}-profile.prom"), "w") as f:
+                f.write(model.profiler.to_prometheus())
+    return model
+
+
+def run_batch(scenarios, steps=None, out_dir=None, trajectory=False, profile=False, events=False, record=False,
+              on_result=None):
+    """Run every scenario and return the finished models by name.
+
+    on_result, if given, is called as on_result(name, steps, seconds) after each scenario.
+    """
+    models = {}
+    for scenario in scenarios:
+        start = time.perf_counter()
+        models[scenario["name"]] = run_scenario(scenario, steps=steps, out_dir=out_dir, trajectory=trajectory,
+                                                   profile=profile, events=events, record=record)
+        if on_result is not None:
+            on_result(scenario["name"], steps or scenario["steps"], time.perf_counter() - start)
+    return models
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run PandemicModel scenarios without the web server.")
+    parser.add_argument("scenarios", nargs="?", help="JSON scenario config (object or list of objects)")
+    parser.add_argument("--steps", type=int, help="override the number of steps of every scenario")
+    parser.add_argument("--out", default="results", help="directory for the DataCollector CSV files")
+    parser.add_argument("--width", type=int)
+    parser.add_argument("--height", type=int)
+    parser.add_argument("--N", type=int)
+    parser.add_argument("--num-hospitals", type=int, dest="num_hospitals")
+    parser.add_argument("--backend", choices=sorted(ENGINES),
+                        help="inference backend (numpy needs export_weights.py, the storage-only numpy-fp16/int8 quantize.py)")
+    parser.add_argument("--seed", type=int, help="seed for every random stream of the model")
+    parser.add_argument("--vaccine-penalty", type=float, dest="vaccine_penalty",
+                        help="subtracted from the infected logit of vaccinated people")
+    parser.add_argument("--infected-neighbor-bonus", type=float, dest="infected_neighbor_bonus",
+                        help="added to the infected logit per infected neighbour")
+    parser.add_argument("--per-agent-moves", action="store_false", dest="batched_moves", default=None,
+                        help="move people one by one through the scheduler instead of in one batch")
+    parser.add_argument("--trajectory", action="store_true", help="also record per-agent trajectories")
+    parser.add_argument("--profile", action="store_true", help="time the step phases and write the results")
+    parser.add_argument("--events", action="store_true", help="also write the event log and contact index")
+    parser.add_argument("--record", action="store_true", help="also record the web UI frames for playback.py")
+    args = parser.parse_args(argv)
+
+    if args.scenarios:
+        scenarios = load_scenarios(args.scenarios)
+    else:
+        scenarios = [dict(DEFAULT_SCENARIO)]
+    for scenario in scenarios:
+        for key in MODEL_PARAMS:
+            if getattr(args, key) is not None:
+                scenario[key] = getattr(args, key)
+
+    run_batch(scenarios, steps=args.steps, out_dir=args.out, trajectory=args.trajectory, profile=args.profile,
+              events=args.events, record=args.record,
+              on_result=lambda name, steps, seconds: print(f"{name}: {steps} steps in {seconds:.2f}s"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""Scaling benchmarks for the ML-driven PandemicModel and the rule-based models.
+
+Runs every combination of model, agent count and density headless with fixed seeds,
+each case in a fresh process so its peak RSS is its own, and reports steps/sec,
+agent-steps/sec, peak RSS and per-step latency percentiles:
+
+    python benchmark.py --sizes 30 3000 100000 --backend numpy --steps 20 --out bench.json
+    python benchmark.py --baseline bench.json --threshold 0.2      # exit code 1 on regressions
+
+The grid of a case is the smallest square (at least 20x20) that holds N agents at the
+given density; the default density 0.075 is the 30 people on 20x20 of the web UI.
+
+The rule-based model has two implementations: "rule" is the agent model of prev.py,
+and "kernel" its vectorized NumPy version sir_kernel.SIRKernel, which matches it within
+sampling error (test_sir_kernel.py). Building prev.py models is quadratic in N, so
+"rule" cases stop at RULE_MAX_AGENTS and "kernel" is the rule baseline at large N.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import platform
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from inference import ENGINES
+
+MODELS = ("ml", "rule", "kernel")
+DEFAULT_SIZES = (30, 300, 3000, 30_000, 100_000)
+DEFAULT_DENSITIES = (0.075,)
+
+# prev.py places every agent with MultiGrid.find_empty, which sorts all empty cells per
+# call, so building the rule model is quadratic; larger rule cases are skipped and
+# the kernel cases stand in for them.
+RULE_MAX_AGENTS = 3000
+
+# Result fields compared against a baseline: True if higher is better.
+METRICS = {"steps_per_sec": True, "agent_steps_per_sec": True, "latency_p50": False,
+           "latency_p99": False, "peak_rss_mb": False}
+
+
+def grid_side(n, density):
+    return max(20, math.ceil(math.sqrt(n / density)))
+
+
+def benchmark_cases(models=MODELS, sizes=DEFAULT_SIZES, densities=DEFAULT_DENSITIES, backend="numpy",
+                    steps=20, warmup=2, seed=0, num_hospitals=3):
+    cases = []
+    for model in models:
+        for n in sizes:
+            if model == "rule" and n > RULE_MAX_AGENTS:
+                continue
+            for density in densities:
+                side = grid_side(n, density)
+                cases.append({"model": model, "backend": backend if model == "ml" else None, "N": n,
+                              "width": side, "height": side, "num_hospitals": num_hospitals,
+                              "density": density, "steps": steps, "warmup": warmup, "seed": seed})
+    return cases
+
+
+def build(case):
+    if case["model"] == "ml":
+        from pandemic_model import PandemicModel
+        return PandemicModel(case["width"], case["height"], case["N"], num_hospitals=case["num_hospitals"],
+                             backend=case["backend"], seed=case["seed"], profile=True)
+    if case["model"] == "kernel":
+        from sir_kernel import SIRKernel
+        return SIRKernel(case["width"], case["height"], case["N"], case["num_hospitals"], seed=case["seed"])
+    from sir_kernel import prev_model
+    return prev_model(case["width"], case["height"], case["N"], case["num_hospitals"], case["seed"])
+
+
+def run_case(case):
+    """Run one case in the current process and return its result dict."""
+    start = time.perf_counter()
+    model = build(case)
+    setup = time.perf_counter() - start
+    for _ in range(case["warmup"]):
+        model.step()
+    profiler = getattr(model, "profiler", None)
+    if profiler is not None:
+        profiler.reset()
+
+    latencies = np.empty(case["steps"])
+    for i in range(case["steps"]):
+        start = time.perf_counter()
+        model.step()
+        latencies[i] = time.perf_counter() - start
+
+    elapsed = latencies.sum()
+    result = dict(case)
+    result.update(
+        setup_seconds=setup,
+        steps_per_sec=case["steps"] / elapsed,
+        agent_steps_per_sec=case["steps"] * case["N"] / elapsed,
+        latency_p50=float(np.percentile(latencies, 50)),
+        latency_p90=float(np.percentile(latencies, 90)),
+        latency_p99=float(np.percentile(latencies, 99)),
+        latency_max=float(latencies.max()),
+        # ru_maxrss is in kilobytes on Linux
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    )
+    if profiler is not None:
+        result["phases"] = {phase: values["mean"] for phase, values in profiler.summary()["phases"].items()}
+    return result
+
+
+def run_benchmarks(cases, on_result=None):
+    """Run each case in its own fresh process and return the results."""
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_case, case).result()
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+    return results
+
+
+def case_key(result):
+    return (result["model"], result["backend"], result["N"], result["width"], result["height"])
+
+
+def compare(results, baseline, threshold=0.2):
+    """Return a list of regressions of results against baseline results.
+
+    A metric regresses when it is worse than the baseline by more than threshold
+    (relative). Cases missing from the baseline are not compared.
+    """
+    previous = {case_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(case_key(result))
+        if old is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if not old.get(metric):
+                continue
+            change = result[metric] / old[metric] - 1
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append({"case": case_key(result), "metric": metric, "baseline": old[metric],
+                                    "value": result[metric], "change": change})
+    return regressions
+
+
+def environment():
+    return {"python": platform.python_version(), "platform": platform.platform(), "numpy": np.__version__,
+            "cpus": multiprocessing.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def save_results(results, path):
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=1)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def format_result(result):
+    name = f"{result['model']}/{result['backend']}" if result["backend"] else result["model"]
+    return (f"{name:10} N={result['N']:<7} {result['width']}x{result['height']:<5} "
+            f"{result['steps_per_sec']:9.2f} steps/s {result['agent_steps_per_sec']:12.0f} agent-steps/s "
+            f"p50 {result['latency_p50'] * 1000:8.2f}ms p99 {result['latency_p99'] * 1000:8.2f}ms "
+            f"rss {result['peak_rss_mb']:7.1f}MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for the pandemic simulation models.")
+    parser.add_argument("--models", nargs="+", choices=MODELS, default=list(MODELS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES), help="agent counts")
+    parser.add_argument("--densities", nargs="+", type=float, default=list(DEFAULT_DENSITIES),
+                        help="agents per cell, sets the grid size of each case")
+    parser.add_argument("--backend", choices=sorted(ENGINES), default="numpy", help="inference backend of the ML model")
+    parser.add_argument("--steps", type=int, default=20, help="measured steps per case")
+    parser.add_argument("--warmup", type=int, default=2, help="unmeasured steps before timing")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", help="compare against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change that counts as a regression")
+    args = parser.parse_args(argv)
+
+    cases = benchmark_cases(args.models, args.sizes, args.densities, args.backend, args.steps, args.warmup, args.seed)
+    results = run_benchmarks(cases, on_result=lambda result: print(format_result(result), flush=True))
+    if args.out:
+        save_results(results, args.out)
+
+    if args.baseline:
+        regressions = compare(results, load_results(args.baseline), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression['case']}: {regression['metric']} {regression['baseline']:.4g} -> "
+                  f"{regression['value']:.4g} ({regression['change']:+.1%})")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
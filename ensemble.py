@@ -0,0 +1,105 @@
+"""Seeded Monte Carlo ensembles of PandemicModel.
+
+Runs K replicas of one scenario on a process pool and aggregates the per-step
+DataCollector series into mean and quantile bands:
+
+    python ensemble.py scenario.json --replicas 64 --seed 7 --steps 100 --backend numpy --out bands.csv
+
+Replica seeds are spawned from the ensemble seed with numpy's SeedSequence, and each
+replica derives all of its random streams from its own seed, so the same ensemble seed
+reproduces bit-identical series regardless of the number of processes or completion order.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from batch_runner import DEFAULT_SCENARIO, build_model, load_scenarios
+from inference import ENGINES
+
+REPORTERS = ("Healthy", "Infected", "Critical", "Chronic", "Vaccinated", "Dead")
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def replica_seeds(seed, replicas):
+    """Independent 64-bit seeds for each replica, derived from one ensemble seed."""
+    children = np.random.SeedSequence(seed).spawn(replicas)
+    return [int(child.generate_state(1, dtype=np.uint64)[0]) for child in children]
+
+
+def run_replica(config, steps, seed):
+    """Run one replica and return its (steps, len(REPORTERS)) DataCollector series."""
+    model = build_model(config, seed=seed)
+    for _ in range(steps):
+        model.step()
+    series = model.datacollector.get_model_vars_dataframe()
+    return series[list(REPORTERS)].to_numpy()
+
+
+def run_ensemble(config, replicas, seed=0, steps=None, processes=None, on_replica=None):
+    """Run replicas of the scenario config and return their stacked series.
+
+    The result has shape (replicas, steps, len(REPORTERS)), in replica order.
+    on_replica(index, seed, series) is called as each replica finishes, in completion order.
+    """
+    scenario = dict(DEFAULT_SCENARIO)
+    scenario.update(config)
+    steps = scenario["steps"] if steps is None else steps
+    seeds = replica_seeds(seed, replicas)
+
+    results = [None] * replicas
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(run_replica, scenario, steps, replica_seed): i
+                   for i, replica_seed in enumerate(seeds)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if on_replica is not None:
+                on_replica(i, seeds[i], results[i])
+    return np.stack(results)
+
+
+def summarize(series, quantiles=DEFAULT_QUANTILES):
+    """Per-step mean and quantile bands of an ensemble, one column per reporter and statistic."""
+    columns = {}
+    mean = series.mean(axis=0)
+    bands = np.quantile(series, quantiles, axis=0)
+    for j, name in enumerate(REPORTERS):
+        columns[f"{name}_mean"] = mean[:, j]
+        for q, band in zip(quantiles, bands):
+            columns[f"{name}_q{round(q * 100):02d}"] = band[:, j]
+    summary = pd.DataFrame(columns)
+    summary.index.name = "step"
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a seeded Monte Carlo ensemble of PandemicModel.")
+    parser.add_argument("scenario", nargs="?", help="JSON scenario config (the first scenario is used)")
+    parser.add_argument("--replicas", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0, help="ensemble seed")
+    parser.add_argument("--steps", type=int)
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--backend", choices=sorted(ENGINES))
+    parser.add_argument("--out", default="ensemble.csv", help="CSV file for the mean/quantile bands")
+    parser.add_argument("--series", help="optional .npy file for the raw (replicas, steps, reporters) series")
+    args = parser.parse_args(argv)
+
+    config = load_scenarios(args.scenario)[0] if args.scenario else dict(DEFAULT_SCENARIO)
+    if args.backend:
+        config["backend"] = args.backend
+
+    def progress(i, seed, series):
+        print(f"replica {i} (seed {seed}) done")
+
+    series = run_ensemble(config, args.replicas, seed=args.seed, steps=args.steps,
+                          processes=args.processes, on_replica=progress)
+    summarize(series).to_csv(args.out)
+    if args.series:
+        np.save(args.series, series)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Append-only binary event log of a PandemicModel run, with a contact-tracing index.
+
+An EventLog attached to a model records state transitions, infections, vaccinations and
+deaths as fixed-size records in <directory>/events.bin. For every infection it also
+stores the unique ids of the infected agents in the Moore neighbourhood (the exposure
+the infection was sampled from) in contacts.bin:
+
+    with EventLog("runs/baseline") as log:
+        model = PandemicModel(20, 20, 30, event_log=log)
+        for _ in range(100):
+            model.step()
+
+    index = EventIndex("runs/baseline")
+    index.events(agent=7, start=10, stop=20)
+    index.contacts(7, start=10, stop=20)      # who exposed agent 7, and whom it exposed
+    index.transmission_chain(7)               # possible infectors, back to the first cases
+
+Closing the log sorts the events by agent and the contacts by contact id into .npy
+files next to the log. EventIndex memory-maps everything and answers queries with
+binary searches, so queries only touch the pages of the matching records.
+"""
+import json
+import os
+
+import numpy as np
+
+from population import INFECTED, STATE_NAMES
+from spatial import MOORE_OFFSETS
+
+EVENT_TYPES = ("state", "infection", "vaccination", "death")
+STATE_CHANGE, INFECTION, VACCINATION, DEATH = range(len(EVENT_TYPES))
+
+EVENT_DTYPE = np.dtype([
+    ("step", "<i4"),
+    ("agent", "<i8"),           # unique_id
+    ("type", "u1"),             # index into EVENT_TYPES
+    ("old_state", "i1"),        # index into population.STATE_NAMES
+    ("new_state", "i1"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("contacts_start", "<i8"),  # first entry of this event in contacts.bin
+    ("contacts_count", "<i4"),
+])
+CONTACT_DTYPE = np.dtype("<i8")
+
+EVENTS_FILE = "events.bin"
+CONTACTS_FILE = "contacts.bin"
+MANIFEST = "manifest.json"
+# Index files written by build_index
+AGENT_ORDER = "agent_order.npy"        # event numbers sorted by agent, then step
+AGENT_KEYS = "agent_keys.npy"          # agent of each entry of AGENT_ORDER
+CONTACT_KEYS = "contact_keys.npy"      # contacts.bin entries sorted by contact id
+CONTACT_EVENTS = "contact_events.npy"  # event number of each entry of CONTACT_KEYS
+
+
+def infected_neighbor_ids(width, height, pos, infected, unique_id, rows):
+    """Unique ids of the infected agents around each of rows, as (ids, counts per row).
+
+    Uses the neighbourhood of spatial.count_infected_neighbors: the 8 surrounding cells,
+    own cell excluded, so counts equals those counts for rows.
+    """
+    sources = np.flatnonzero(infected & (pos[:, 0] >= 0))
+    source_cells = pos[sources, 0] * height + pos[sources, 1]
+    order = np.argsort(source_cells, kind="stable")
+    sources, source_cells = sources[order], source_cells[order]
+
+    x, y = pos[rows, 0], pos[rows, 1]
+    first = np.zeros((len(rows), len(MOORE_OFFSETS)), dtype=np.intp)
+    count = np.zeros((len(rows), len(MOORE_OFFSETS)), dtype=np.intp)
+    for k, (dx, dy) in enumerate(MOORE_OFFSETS):
+        nx, ny = x + dx, y + dy
+        inside = (nx >= 0) & (nx < width) & (ny >= 0) & (ny < height)
+        cells = nx * height + ny
+        first[:, k] = np.searchsorted(source_cells, cells, side="left")
+        count[:, k] = np.where(inside, np.searchsorted(source_cells, cells, side="right") - first[:, k], 0)
+
+    # Expand every (row, offset) range [first, first + count) of the sorted sources, row by row.
+    first, count = first.ravel(), count.ravel()
+    total = count.sum()
+    offsets = np.repeat(first - (np.cumsum(count) - count), count) + np.arange(total)
+    return unique_id[sources[offsets]], count.reshape(len(rows), -1).sum(axis=1)
+
+
+class EventLog:
+    """Buffered writer of events.bin and contacts.bin; pass it as PandemicModel(event_log=...)."""
+
+    def __init__(self, directory, buffer_events=1_000_000):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.buffer_events = buffer_events
+        self._events = open(os.path.join(directory, EVENTS_FILE), "wb")
+        self._contacts = open(os.path.join(directory, CONTACTS_FILE), "wb")
+        self._pending = []
+        self._pending_contacts = []
+        self._pending_count = 0
+        self.events = 0
+        self.contacts = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def state_changes(self, model, rows, new_states):
+        """Log the transitions of rows to new_states; call before the states are stored.
+
+        Transitions into "infected" are logged as infections, with the infected agents
+        around the agent (under the states before the update) as contacts.
+        """
+        population = model.population
+        old_states = population.state[rows]
+        changed = old_states != new_states
+        rows, old_states, new_states = rows[changed], old_states[changed], new_states[changed]
+        infection = new_states == INFECTED
+        types = np.where(infection, INFECTION, STATE_CHANGE).astype(np.uint8)
+
+        counts = np.zeros(len(rows), dtype=np.int64)
+        contacts = np.empty(0, dtype=np.int64)
+        if infection.any():
+            size = population.size
+            contacts, counts[infection] = infected_neighbor_ids(
+                model.grid.width, model.grid.height, population.pos[:size], population.state[:size] == INFECTED,
+                population.unique_id[:size], rows[infection])
+        self._append(model, rows, types, old_states, new_states, counts, contacts)
+
+    def vaccinations(self, model, rows):
+        # Vaccinations happen in the move phase, before the schedule counts the step.
+        state = model.population.state[rows]
+        self._append(model, rows, VACCINATION, state, state, step=model.schedule.steps + 1)
+
+    def deaths(self, model, rows, old_states):
+        self._append(model, rows, DEATH, old_states, model.population.state[rows])
+
+    def _append(self, model, rows, types, old_states, new_states, counts=None, contacts=None, step=None):
+        if len(rows) == 0:
+            return
+        population = model.population
+        records = np.zeros(len(rows), dtype=EVENT_DTYPE)
+        records["step"] = model.schedule.steps if step is None else step
+        records["agent"] = population.unique_id[rows]
+        records["type"] = types
+        records["old_state"] = old_states
+        records["new_state"] = new_states
+        records["x"] = population.pos[rows, 0]
+        records["y"] = population.pos[rows, 1]
+        if counts is not None:
+            records["contacts_count"] = counts
+            records["contacts_start"] = self.contacts + np.cumsum(counts) - counts
+            self._pending_contacts.append(np.asarray(contacts, dtype=CONTACT_DTYPE))
+            self.contacts += len(contacts)
+        self._pending.append(records)
+        self._pending_count += len(records)
+        self.events += len(records)
+        if self._pending_count >= self.buffer_events:
+            self.flush()
+
+    def flush(self):
+        for records in self._pending:
+            self._events.write(records.tobytes())
+        for contacts in self._pending_contacts:
+            self._contacts.write(contacts.tobytes())
+        self._pending, self._pending_contacts, self._pending_count = [], [], 0
+        self._events.flush()
+        self._contacts.flush()
+
+    def close(self, index=True):
+        if self._events.closed:
+            return
+        self.flush()
+        self._events.close()
+        self._contacts.close()
+        manifest = {
+            "events": self.events,
+            "contacts": self.contacts,
+            "event_dtype": EVENT_DTYPE.descr,
+            "event_types": list(EVENT_TYPES),
+            "states": list(STATE_NAMES),
+        }
+        with open(os.path.join(self.directory, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=1)
+        if index:
+            build_index(self.directory)
+
+
+def read_events(directory):
+    """Memory maps of the events and contacts of a closed log."""
+    events, contacts = (os.path.join(directory, name) for name in (EVENTS_FILE, CONTACTS_FILE))
+    events = np.memmap(events, dtype=EVENT_DTYPE, mode="r") if os.path.getsize(events) else np.zeros(0, EVENT_DTYPE)
+    contacts = np.memmap(contacts, dtype=CONTACT_DTYPE, mode="r") if os.path.getsize(contacts) else np.zeros(0, CONTACT_DTYPE)
+    return events, contacts
+
+
+def build_index(directory):
+    """Write the agent and contact sort orders of a closed log."""
+    events, contacts = read_events(directory)
+    # Events are logged in step order, so a stable sort keeps them by step within an agent.
+    agent_order = np.argsort(events["agent"], kind="stable")
+    np.save(os.path.join(directory, AGENT_ORDER), agent_order)
+    np.save(os.path.join(directory, AGENT_KEYS), events["agent"][agent_order])
+    del agent_order
+
+    contact_events = np.repeat(np.arange(len(events), dtype=np.int64), events["contacts_count"])
+    contact_order = np.argsort(contacts, kind="stable")
+    np.save(os.path.join(directory, CONTACT_KEYS), np.asarray(contacts)[contact_order])
+    np.save(os.path.join(directory, CONTACT_EVENTS), contact_events[contact_order])
+
+
+class EventIndex:
+    """Queries on a closed, indexed event log; all files are memory-mapped."""
+
+    def __init__(self, directory):
+        self.records, self.contact_ids = read_events(directory)
+        load = lambda name: np.load(os.path.join(directory, name), mmap_mode="r")
+        self.agent_order, self.agent_keys = load(AGENT_ORDER), load(AGENT_KEYS)
+        self.contact_keys, self.contact_events = load(CONTACT_KEYS), load(CONTACT_EVENTS)
+
+    def _agent_event_numbers(self, agent, start=None, stop=None):
+        """Numbers of agent's events with start <= step < stop, in step order."""
+        lo, hi = np.searchsorted(self.agent_keys, [agent, agent + 1])
+        numbers = np.asarray(self.agent_order[lo:hi])
+        return self._step_range(numbers, start, stop)
+
+    def _step_range(self, numbers, start, stop):
+        steps = self.records["step"][numbers]
+        lo = 0 if start is None else np.searchsorted(steps, start)
+        hi = len(numbers) if stop is None else np.searchsorted(steps, stop)
+        return numbers[lo:hi]
+
+    def events_of(self, numbers):
+        return np.asarray(self.records[numbers])
+
+    def events(self, agent, start=None, stop=None, types=None):
+        """Events of agent with start <= step < stop, optionally only the given EVENT_TYPES names."""
+        records = self.events_of(self._agent_event_numbers(agent, start, stop))
+        if types is not None:
+            records = records[np.isin(records["type"], [EVENT_TYPES.index(name) for name in types])]
+        return records
+
+    def event_contacts(self, record):
+        start = int(record["contacts_start"])
+        return np.asarray(self.contact_ids[start:start + int(record["contacts_count"])])
+
+    def contacts(self, agent, start=None, stop=None):
+        """Contacts of agent with start <= step < stop as a (step, agent, direction) array.
+
+        direction is "source" for infected agents around agent when it was infected and
+        "exposed" for agents that were infected with agent around them.
+        """
+        rows = []
+        for record in self.events(agent, start, stop, types=["infection"]):
+            rows += [(record["step"], contact, "source") for contact in self.event_contacts(record)]
+        lo, hi = np.searchsorted(self.contact_keys, [agent, agent + 1])
+        for record in self.events_of(self._step_range(np.asarray(self.contact_events[lo:hi]), start, stop)):
+            rows.append((record["step"], record["agent"], "exposed"))
+        result = np.array(rows, dtype=[("step", "<i4"), ("agent", "<i8"), ("direction", "U7")])
+        return np.sort(result, order=["step", "agent"])
+
+    def infection_before(self, agent, step=None):
+        """The latest infection event of agent before step (any step if None), or None."""
+        records = self.events(agent, stop=step, types=["infection"])
+        return records[-1] if len(records) else None
+
+    def transmission_chain(self, agent, step=None, max_depth=None):
+        """Possible infectors of agent's latest infection before step, traced back recursively.
+
+        Returns a list of {"agent", "step", "sources"} dicts, breadth first; an agent with
+        no logged infection (e.g. infected from the start) ends its branch.
+        """
+        chain = []
+        seen = set()
+        frontier = [(agent, step)]
+        depth = 0
+        while frontier and (max_depth is None or depth <= max_depth):
+            next_frontier = []
+            for current, before in frontier:
+                if current in seen:
+                    continue
+                seen.add(current)
+                record = self.infection_before(current, before)
+                if record is None:
+                    continue
+                sources = self.event_contacts(record)
+                chain.append({"agent": int(current), "step": int(record["step"]), "sources": sources.tolist()})
+                next_frontier += [(int(source), int(record["step"])) for source in sources]
+            frontier = next_frontier
+            depth += 1
+        return chain
@@ -0,0 +1,99 @@
+"""Export the Keras models to a .npz file for the TensorFlow-free "numpy" backend.
+
+    python export_weights.py [--out model_weights.npz] [--tolerance 1e-4]
+
+After writing the weights the NumPy forward pass is checked against the Keras models on
+random vitals histories; the export fails if any output differs by more than the tolerance.
+"""
+import argparse
+
+import numpy as np
+
+from inference import HEALTH_MODEL_PATH, PARAMETER_MODEL_PATH, WEIGHTS_PATH, NumpyEngine, load_keras_models
+from population import INITIAL_VITALS_HIGH, INITIAL_VITALS_LOW, NUM_VITALS
+
+# Keras layers that only build the mask or feed inputs; the NumPy pass recomputes the mask itself.
+SKIPPED_LAYERS = ("InputLayer", "NotEqual", "Any", "Masking")
+
+
+def network_weights(model, name):
+    """Flatten a Keras model into the op list and weight arrays read by NumpyNetwork."""
+    ops = []
+    arrays = {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in SKIPPED_LAYERS:
+            continue
+        i = len(ops)
+        if kind == "LSTM":
+            if layer.activation.__name__ != "tanh" or layer.recurrent_activation.__name__ != "sigmoid":
+                raise ValueError(f"{layer.name}: only tanh/sigmoid LSTMs are supported")
+            kernel, recurrent_kernel, bias = layer.get_weights()
+            arrays.update({f"{name}.{i}.kernel": kernel, f"{name}.{i}.recurrent_kernel": recurrent_kernel,
+                           f"{name}.{i}.bias": bias})
+            ops.append("lstm")
+        elif kind == "GlobalAveragePooling1D":
+            ops.append("masked_mean")
+        elif kind == "Concatenate":
+            ops.append("concat_state")
+        elif kind == "Dense":
+            kernel, bias = layer.get_weights()
+            arrays.update({f"{name}.{i}.kernel": kernel, f"{name}.{i}.bias": bias})
+            ops.append("dense:" + layer.activation.__name__)
+        else:
+            raise ValueError(f"{layer.name}: unsupported layer type {kind}")
+    arrays[f"{name}.ops"] = np.array(ops)
+    return arrays
+
+
+def export_weights(out_path=WEIGHTS_PATH, models=None):
+    parameter_model, health_model = models or load_keras_models()
+    arrays = {}
+    arrays.update(network_weights(parameter_model, "parameter"))
+    arrays.update(network_weights(health_model, "health"))
+    np.savez_compressed(out_path, **arrays)
+    return out_path
+
+
+def random_histories(n, length, rng):
+    """Vitals histories in the ranges Person uses for its initial values."""
+    return rng.uniform(INITIAL_VITALS_LOW, INITIAL_VITALS_HIGH, size=(n, length, NUM_VITALS)).astype(np.float32)
+
+
+def check_parity(weights_path=WEIGHTS_PATH, models=None, n=256, seed=0):
+    """Largest absolute difference between the Keras and NumPy outputs of both models."""
+    parameter_model, health_model = models or load_keras_models()
+    engine = NumpyEngine(weights_path)
+    rng = np.random.default_rng(seed)
+    state_diff = vitals_diff = 0.0
+    for length in (5, 12, 20):
+        seq = random_histories(n, length, rng)
+        # Zeroed time steps exercise the Masking layer
+        seq[rng.random((n, length)) < 0.1] = 0.0
+        states = np.eye(4, dtype=np.float32)[rng.integers(0, 4, n)]
+        expected_states = parameter_model([seq], training=False).numpy()
+        expected_vitals = health_model([seq, states], training=False).numpy()
+        state_diff = max(state_diff, float(np.abs(engine.predict_states(seq) - expected_states).max()))
+        vitals_diff = max(vitals_diff, float(np.abs(engine.predict_vitals(seq, states) - expected_vitals).max()))
+    return state_diff, vitals_diff
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the Keras models for the numpy inference backend.")
+    parser.add_argument("--out", default=WEIGHTS_PATH)
+    parser.add_argument("--tolerance", type=float, default=1e-4,
+                        help="largest allowed absolute difference from the Keras outputs")
+    args = parser.parse_args(argv)
+
+    models = load_keras_models()
+    export_weights(args.out, models)
+    state_diff, vitals_diff = check_parity(args.out, models)
+    print(f"{PARAMETER_MODEL_PATH}: max abs diff {state_diff:.2e}")
+    print(f"{HEALTH_MODEL_PATH}: max abs diff {vitals_diff:.2e}")
+    if max(state_diff, vitals_diff) > args.tolerance:
+        raise SystemExit(f"NumPy outputs differ from Keras by more than {args.tolerance}")
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""Inference backends for the parameter and health time series models.
+
+An engine exposes two calls, both taking the (n, length, 4) vitals history:
+
+    predict_states(seq)         -> (n, 4) parameter_model outputs (healthy, infected, critical, chronic)
+    predict_vitals(seq, states) -> (n, 4) next vitals given one-hot states in the same order
+"""
+import functools
+import os
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PARAMETER_MODEL_PATH = os.path.join(BASE_DIR, "parameter_model.keras")
+HEALTH_MODEL_PATH = os.path.join(BASE_DIR, "health_time_series_model.keras")
+WEIGHTS_PATH = os.path.join(BASE_DIR, "model_weights.npz")  # written by export_weights.py
+# Reduced-precision copies of WEIGHTS_PATH, written by quantize.py. They are storage-only:
+# the weights are dequantized to float32 on load, so only the files are smaller.
+FP16_WEIGHTS_PATH = os.path.join(BASE_DIR, "model_weights_fp16.npz")
+INT8_WEIGHTS_PATH = os.path.join(BASE_DIR, "model_weights_int8.npz")
+SCALE_PREFIX = "scale/"  # per-output-channel scale of an int8 array, stored as SCALE_PREFIX + key
+
+# Engines are created on first use and shared by every model in the process.
+_engines = {}
+
+
+def load_keras_models():
+    """Return (parameter_model, health_time_series_model) loaded with Keras."""
+    from tensorflow.keras.models import load_model
+    return load_model(PARAMETER_MODEL_PATH), load_model(HEALTH_MODEL_PATH)
+
+
+def bucket_size(n, min_bucket=8):
+    """Smallest power of two >= n (and >= min_bucket) used as the padded batch size."""
+    size = min_bucket
+    while size < n:
+        size *= 2
+    return size
+
+
+def pad_batch(batch, size):
+    """Pad a batch to size rows by repeating its last row."""
+    if len(batch) == size:
+        return batch
+    return np.concatenate([batch, np.repeat(batch[-1:], size - len(batch), axis=0)])
+
+
+class KerasEngine:
+    """Calls the Keras models through tf.function instead of Model.predict().
+
+    predict() builds a data adapter and callbacks on every call and retraces whenever the
+    batch size changes, which dominates the step time for small and medium populations.
+    Batches are padded to power-of-two buckets and reduce_retracing lets the growing
+    history length (5 to 20 steps) share a generalized trace, so the functions are traced
+    a handful of times per run however many agents are still alive.
+    """
+
+    def __init__(self, parameter_model=None, health_model=None, min_bucket=8, jit_compile=False):
+        import tensorflow as tf
+
+        if parameter_model is None or health_model is None:
+            parameter_model, health_model = load_keras_models()
+        self.parameter_model = parameter_model
+        self.health_model = health_model
+        self.min_bucket = min_bucket
+        self._predict_states = tf.function(
+            lambda seq: parameter_model([seq], training=False),
+            jit_compile=jit_compile, reduce_retracing=True)
+        self._predict_vitals = tf.function(
+            lambda seq, states: health_model([seq, states], training=False),
+            jit_compile=jit_compile, reduce_retracing=True)
+
+    def predict_states(self, seq):
+        n = len(seq)
+        seq = pad_batch(np.asarray(seq, dtype=np.float32), bucket_size(n, self.min_bucket))
+        return self._predict_states(seq).numpy()[:n]
+
+    def predict_vitals(self, seq, states):
+        n = len(seq)
+        size = bucket_size(n, self.min_bucket)
+        seq = pad_batch(np.asarray(seq, dtype=np.float32), size)
+        states = pad_batch(np.asarray(states, dtype=np.float32), size)
+        return self._predict_vitals(seq, states).numpy()[:n]
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def lstm_forward(seq, mask, kernel, recurrent_kernel, bias):
+    """Keras LSTM (gate order i, f, c, o) returning the full output sequence.
+
+    Masked time steps carry the previous state and output forward, as Keras does with
+    zero_output_for_mask=False.
+    """
+    n, length, _ = seq.shape
+    units = recurrent_kernel.shape[0]
+    inputs = seq @ kernel + bias
+    h = np.zeros((n, units), dtype=np.float32)
+    c = np.zeros((n, units), dtype=np.float32)
+    outputs = np.empty((n, length, units), dtype=np.float32)
+    for t in range(length):
+        z = inputs[:, t] + h @ recurrent_kernel
+        i = sigmoid(z[:, :units])
+        f = sigmoid(z[:, units:2 * units])
+        g = np.tanh(z[:, 2 * units:3 * units])
+        o = sigmoid(z[:, 3 * units:])
+        c_new = f * c + i * g
+        h_new = o * np.tanh(c_new)
+        step_mask = mask[:, t, None]
+        c = np.where(step_mask, c_new, c)
+        h = np.where(step_mask, h_new, h)
+        outputs[:, t] = h
+    return outputs
+
+
+def masked_mean(outputs, mask):
+    """GlobalAveragePooling1D over the unmasked time steps."""
+    mask = mask[:, :, None].astype(outputs.dtype)
+    return (outputs * mask).sum(axis=1) / mask.sum(axis=1)
+
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0),
+    "softmax": softmax,
+}
+
+
+def load_weight(weights, key):
+    """A weight array of an .npz export as float32, dequantizing int8 arrays with their scales."""
+    array = weights[key]
+    if array.dtype == np.int8:
+        return array.astype(np.float32) * weights[SCALE_PREFIX + key]
+    return array.astype(np.float32)
+
+
+class NumpyNetwork:
+    """Pure NumPy forward pass of one exported model.
+
+    The network is a list of ops as written by export_weights.py: "lstm", "masked_mean",
+    "concat_state" and "dense:<activation>", with the weights of op i stored as
+    "<name>.<i>.<weight>" in the .npz file. Weights may be stored in reduced precision
+    (see quantize.py); the forward pass always runs in float32.
+    """
+
+    def __init__(self, weights, name):
+        self.ops = []
+        for i, op in enumerate(weights[f"{name}.ops"]):
+            op = str(op)
+            kind, _, activation = op.partition(":")
+            params = {key.rsplit(".", 1)[1]: load_weight(weights, key)
+                      for key in weights if key.startswith(f"{name}.{i}.")}
+            self.ops.append((kind, activation, params))
+
+    def __call__(self, seq, states=None):
+        seq = np.asarray(seq, dtype=np.float32)
+        # Masking(mask_value=0.0): a time step is skipped when all of its vitals are zero
+        mask = np.any(seq != 0.0, axis=-1)
+        x = seq
+        for kind, activation, params in self.ops:
+            if kind == "lstm":
+                x = lstm_forward(x, mask, params["kernel"], params["recurrent_kernel"], params["bias"])
+            elif kind == "masked_mean":
+                x = masked_mean(x, mask)
+            elif kind == "concat_state":
+                x = np.concatenate([x, np.asarray(states, dtype=np.float32)], axis=-1)
+            elif kind == "dense":
+                x = ACTIVATIONS[activation](x @ params["kernel"] + params["bias"])
+            else:
+                raise ValueError(f"unknown op {kind!r} in exported weights")
+        return x
+
+
+class NumpyEngine:
+    """Runs the exported model weights with NumPy only, without importing TensorFlow."""
+
+    def __init__(self, path=WEIGHTS_PATH, weights=None):
+        """Load the export at path, or use weights, a dict of the arrays of an export."""
+        if weights is None:
+            if not os.path.exists(path):
+                script = "export_weights.py" if path == WEIGHTS_PATH else "quantize.py"
+                raise FileNotFoundError(f"{path} not found, run {script} to create it")
+            with np.load(path) as npz:
+                weights = dict(npz)
+        self.parameter_network = NumpyNetwork(weights, "parameter")
+        self.health_network = NumpyNetwork(weights, "health")
+
+    def predict_states(self, seq):
+        return self.parameter_network(seq)
+
+    def predict_vitals(self, seq, states):
+        return self.health_network(seq, states)
+
+
+ENGINES = {
+    "keras": KerasEngine,
+    "numpy": NumpyEngine,
+    # Same float32 arithmetic as "numpy", loaded from the smaller quantize.py files
+    "numpy-fp16": functools.partial(NumpyEngine, FP16_WEIGHTS_PATH),
+    "numpy-int8": functools.partial(NumpyEngine, INT8_WEIGHTS_PATH),
+}
+
+
+def engine_name(backend):
+    """Name of backend in ENGINES: backend itself if it is a name, the name of a shared
+    engine returned by get_engine, or None for any other engine object."""
+    if isinstance(backend, str):
+        return backend
+    return next((name for name, engine in _engines.items() if engine is backend), None)
+
+
+def get_engine(backend="keras"):
+    """Return the shared inference engine for backend, creating it on first use.
+
+    backend is the name of an engine in ENGINES, or an engine object which is used as is
+    (e.g. an inference_server.InferenceClient).
+    """
+    if not isinstance(backend, str):
+        return backend
+    if backend not in _engines:
+        if backend not in ENGINES:
+            raise ValueError(f"unknown inference backend {backend!r}, expected one of {sorted(ENGINES)}")
+        _engines[backend] = ENGINES[backend]()
+    return _engines[backend]
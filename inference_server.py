@@ -0,0 +1,180 @@
+"""Shared batching inference for many PandemicModel replicas in one process.
+
+Each replica normally calls the models with its own small batch. A
+BatchingInferenceServer owns a single engine on a background thread and merges the
+requests of all replicas into large batches:
+
+    with BatchingInferenceServer("keras", max_batch_size=8192, max_wait=0.002) as server:
+        models = run_replicas([{"width": 20, "height": 20, "N": 30}] * 16, server, steps=100)
+        print(server.metrics())
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from inference import get_engine
+
+
+class _Request:
+    __slots__ = ("kind", "seq", "states", "future")
+
+    def __init__(self, kind, seq, states):
+        self.kind = kind
+        self.seq = np.asarray(seq, dtype=np.float32)
+        self.states = None if states is None else np.asarray(states, dtype=np.float32)
+        self.future = Future()
+
+
+class InferenceClient:
+    """Engine interface that forwards every call to a BatchingInferenceServer.
+
+    Pass it as the backend of a PandemicModel: PandemicModel(..., backend=server.client()).
+    """
+
+    def __init__(self, server):
+        self.server = server
+
+    def predict_states(self, seq):
+        return self.server.submit("states", seq).result()
+
+    def predict_vitals(self, seq, states):
+        return self.server.submit("vitals", seq, states).result()
+
+
+class BatchingInferenceServer:
+    """Background thread that runs merged predict requests on one shared engine.
+
+    A batch is closed once it holds max_batch_size rows or max_wait seconds have passed
+    since its first request. Requests are grouped by model and history length, since
+    only sequences of equal length can be stacked.
+    """
+
+    def __init__(self, backend="keras", max_batch_size=4096, max_wait=0.002):
+        self.engine = get_engine(backend)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._requests = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.reset_metrics()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._serve, name="inference-server", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._requests.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def client(self):
+        return InferenceClient(self)
+
+    def submit(self, kind, seq, states=None):
+        """Queue a request and return a Future with its (n, 4) result."""
+        if self._thread is None:
+            raise RuntimeError("inference server is not running")
+        request = _Request(kind, seq, states)
+        self._requests.put(request)
+        return request.future
+
+    def reset_metrics(self):
+        with self._lock:
+            self._started = time.perf_counter()
+            self._counts = {"requests": 0, "batches": 0, "rows": 0, "busy_seconds": 0.0}
+
+    def metrics(self):
+        """Throughput counters since start or the last reset_metrics()."""
+        with self._lock:
+            counts = dict(self._counts)
+            elapsed = time.perf_counter() - self._started
+        batches = max(counts["batches"], 1)
+        counts.update(
+            elapsed_seconds=elapsed,
+            rows_per_batch=counts["rows"] / batches,
+            requests_per_batch=counts["requests"] / batches,
+            rows_per_second=counts["rows"] / elapsed if elapsed > 0 else 0.0,
+            utilization=counts["busy_seconds"] / elapsed if elapsed > 0 else 0.0,
+        )
+        return counts
+
+    def _serve(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            batch = [request]
+            rows = len(request.seq)
+            deadline = time.perf_counter() + self.max_wait
+            stopping = False
+            while rows < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+                rows += len(request.seq)
+            self._run(batch)
+            if stopping:
+                return
+
+    def _run(self, batch):
+        groups = {}
+        for request in batch:
+            groups.setdefault((request.kind, request.seq.shape[1]), []).append(request)
+
+        start = time.perf_counter()
+        for (kind, _), requests in groups.items():
+            try:
+                seq = np.concatenate([request.seq for request in requests])
+                if kind == "states":
+                    results = self.engine.predict_states(seq)
+                else:
+                    states = np.concatenate([request.states for request in requests])
+                    results = self.engine.predict_vitals(seq, states)
+            except Exception as exc:
+                for request in requests:
+                    request.future.set_exception(exc)
+                continue
+            offset = 0
+            for request in requests:
+                request.future.set_result(results[offset:offset + len(request.seq)])
+                offset += len(request.seq)
+
+        with self._lock:
+            self._counts["requests"] += len(batch)
+            self._counts["batches"] += len(groups)
+            self._counts["rows"] += sum(len(request.seq) for request in batch)
+            self._counts["busy_seconds"] += time.perf_counter() - start
+
+
+def run_replicas(configs, server, steps):
+    """Run one PandemicModel per config on its own thread, all sharing server for inference."""
+    from pandemic_model import PandemicModel
+
+    def run(config):
+        model = PandemicModel(**config, backend=server.client())
+        for _ in range(steps):
+            model.step()
+        return model
+
+    with ThreadPoolExecutor(max_workers=len(configs)) as pool:
+        return list(pool.map(run, configs))
@@ -1,2 +1,478 @@
-import mesa
-help(mesa)
+from mesa import Model, Agent
+from mesa.space import MultiGrid
+from mesa.time import RandomActivation
+from mesa.datacollection import DataCollector
+import numpy as np
+
+from population import (PopulationStore, STATE_NAMES, STATE_CODES, INFECTED, CRITICAL, DEAD, INITIAL_HISTORY,
+                        INITIAL_VITALS_LOW, INITIAL_VITALS_HIGH, PATIENT_ZERO_VITALS)
+from spatial import count_infected_neighbors, random_moves
+from inference import get_engine
+from profiling import StepProfiler, profile_reporters
+
+# Define a softmax function to convert raw regression outputs to probabilities
+# def softmax(x):
+#     e_x = np.exp(x - np.max(x))
+#     return e_x / e_x.sum()
+
+# One-hot encoder for health state for the health_time_series_model.
+# Expected order for the health_time_series_model is: chronic, critical, healthy, infected.
+state_encoder = {
+    'chronic':  [1, 0, 0, 0],
+    'critical': [0, 1, 0, 0],
+    'healthy': [0, 0, 1, 0],
+    'infected':  [0, 0, 0, 1]
+}
+
+# state_to_target = {
+#     'healthy':  [1, 0, 0, 0],
+#     'infected': [0, 1, 0, 0],
+#     'critical': [0, 0, 1, 0],
+#     'chronic':  [0, 0, 0, 1]
+# }
+
+# Order of states as output by the parameter_model (logits in this order)
+states_order_param = ["healthy", "infected", "critical", "chronic"]
+
+def encode_state(state):
+    encoding = [0] * len(states_order_param)
+    encoding[states_order_param.index(state)] = 1
+    return encoding
+# states_order_health = ["chronic", "critical", "healthy", "infected"]
+
+# Constants for modifying logits
+VACCINE_PENALTY = 1.0       # subtract from infected logit if vaccinated
+INFECTED_NEIGHBOR_BONUS = 0.5  # add per infected neighbor
+
+def sample_states(parameter_logits, infected_neighbors, vaccinated, rng,
+                  infected_neighbor_bonus=INFECTED_NEIGHBOR_BONUS, vaccine_penalty=VACCINE_PENALTY):
+    """Adjust the parameter_model outputs, softmax them and draw one state code per row."""
+    logits = np.array(parameter_logits, dtype=np.float64)
+    # Increase infected logit per infected neighbour, decrease it if vaccinated
+    logits[:, 1] += infected_neighbor_bonus * infected_neighbors - vaccine_penalty * vaccinated
+    logits -= logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    if len(probs) == 1:
+        return np.argmax(probs, axis=1).astype(np.int8)
+    # Inverse-CDF sampling, as np.random.choice does, for all rows at once
+    cdf = np.cumsum(probs, axis=1)
+    cdf /= cdf[:, -1:]
+    u = rng.random(len(probs))
+    return (cdf <= u[:, None]).sum(axis=1).astype(np.int8)
+
+
+# Simple death thresholds based on predicted health parameters
+DEAD_VITALS = np.array([0, 82, 0, 0], dtype=np.float32)
+
+
+def death_mask(vitals, critical_steps):
+    # Example thresholds: if blood pressure or heart rate fall below safe limits, mark as dead.
+    bp, temp, rr, hr = vitals[:, 0], vitals[:, 1], vitals[:, 2], vitals[:, 3]
+    return ((critical_steps > 5) | (bp <= 60) | (bp >= 160) | (temp >= 105) | (temp <= 93)
+            | (rr >= 30) | (rr <= 7) | (hr <= 25) | (hr >= 120))
+
+
+def advance_critical_steps(population):
+    """Count one more critical step for critical agents and reset everyone else's streak."""
+    critical = population.state[:population.size] == CRITICAL
+    # Write only the rows that change (see PopulationStore.set_states)
+    population.critical_steps[np.flatnonzero(critical)] += 1
+    population.critical_steps[np.flatnonzero(~critical & (population.critical_steps[:population.size] != 0))] = 0
+
+
+def check_death(population, rows):
+    """Mark the agents in rows whose latest vitals cross the death thresholds as dead."""
+    rows = rows[~population.dead[rows]]
+    dying = rows[death_mask(population.latest()[rows], population.critical_steps[rows])]
+    population.set_dead(dying)
+    population.set_states(dying, DEAD)
+    population.critical_steps[dying] = 0
+    population.set_latest(dying, DEAD_VITALS)
+    return dying
+
+
+def advance_health(model, rows, infected_neighbors):
+    """Advance health state and vitals of the live agents in rows (sorted, unique) by one step.
+
+    infected_neighbors holds the infected neighbour counts of rows. model is a
+    PandemicModel, or an object with the attributes used below (sharding.Shard).
+    """
+    population = model.population
+    profiler = model.profiler
+
+    # The full population is passed to the models as a view of the vitals ring buffer;
+    # only a subset (once agents have died) needs to be gathered.
+    seq_flat_batch = population.history_window()
+    if len(rows) != population.size:
+        seq_flat_batch = seq_flat_batch[rows]
+    vaccinated_batch = population.vaccinated[rows]
+    profiler.lap("neighbors")
+
+    # Step 1: Parameter model prediction, then pick each agent's next state
+    engine = get_engine(model.backend)
+    parameter_logits_batch = engine.predict_states(seq_flat_batch)
+    profiler.lap("parameter_predict")
+    state_codes = sample_states(parameter_logits_batch, infected_neighbors, vaccinated_batch, model.np_random,
+                                model.infected_neighbor_bonus, model.vaccine_penalty)
+
+    # Step 2: Update agent states based on chosen states
+    if model.adaptive is not None:
+        changed = population.state[rows] != state_codes
+    if model.event_log is not None:
+        model.event_log.state_changes(model, rows, state_codes)
+    population.set_states(rows, state_codes)
+    encoder_vector_batch = np.eye(len(states_order_param), dtype=np.float32)[state_codes]
+    profiler.lap("sampling")
+
+    # Step 3: Health time series model prediction using updated states
+    if model.adaptive is None:
+        predicted_params_batch = engine.predict_vitals(seq_flat_batch, encoder_vector_batch)
+    else:
+        predicted_params_batch = model.adaptive.predict_vitals(engine, seq_flat_batch, encoder_vector_batch, rows,
+                                                               changed, model.schedule.steps)
+    profiler.lap("health_predict")
+
+    # Step 4: Update agent health history and check for death
+    population.push(rows, predicted_params_batch)
+    dying = check_death(population, rows)
+    model.events["death"] += len(dying)
+    if model.event_log is not None:
+        model.event_log.deaths(model, dying, state_codes[np.searchsorted(rows, dying)])
+    profiler.lap("check_death")
+
+
+class Person(Agent):
+    """A person in the simulation; a thin view onto one row of model.population."""
+    def __init__(self, unique_id, model):
+        super().__init__(unique_id, model)
+        self.critical_delay = 0
+        self.infected_timer = 0
+
+        if unique_id != 0:
+            state = self.random.choice(["healthy", "infected", "critical", "chronic"])
+            health_history = [
+                np.array([self.random.uniform(low, high) for low, high in zip(INITIAL_VITALS_LOW, INITIAL_VITALS_HIGH)])
+                for _ in range(INITIAL_HISTORY)
+            ]
+        else:
+            state = "critical"
+            health_history = [np.array(PATIENT_ZERO_VITALS) for _ in range(INITIAL_HISTORY)]
+        self.idx = model.population.add(unique_id, state, health_history)
+
+    @classmethod
+    def from_row(cls, model, row, critical_delay=0, infected_timer=0):
+        """A Person bound to an existing row of model.population (used when restoring snapshots)."""
+        person = cls.__new__(cls)
+        Agent.__init__(person, int(model.population.unique_id[row]), model)
+        person.idx = row
+        person.critical_delay = critical_delay
+        person.infected_timer = infected_timer
+        return person
+
+    @property
+    def state(self):
+        return STATE_NAMES[self.model.population.state[self.idx]]
+
+    @state.setter
+    def state(self, value):
+        self.model.population.set_states(self.idx, STATE_CODES[value])
+
+    @property
+    def is_vaccinated(self):
+        return bool(self.model.population.vaccinated[self.idx])
+
+    @is_vaccinated.setter
+    def is_vaccinated(self, value):
+        self.model.population.set_vaccinated(self.idx, value)
+
+    @property
+    def is_dead(self):
+        return bool(self.model.population.dead[self.idx])
+
+    @is_dead.setter
+    def is_dead(self, value):
+        self.model.population.set_dead(self.idx, value)
+
+    @property
+    def critical_steps(self):
+        return int(self.model.population.critical_steps[self.idx])
+
+    @critical_steps.setter
+    def critical_steps(self, value):
+        if self.model.population.critical_steps[self.idx] != value:
+            self.model.population.critical_steps[self.idx] = value
+
+    @property
+    def pos(self):
+        x, y = self.model.population.pos[self.idx]
+        return None if x < 0 else (int(x), int(y))
+
+    @pos.setter
+    def pos(self, value):
+        # Agent.__init__ resets pos before the agent has a row in the store.
+        if not hasattr(self, "idx"):
+            return
+        value = (-1, -1) if value is None else value
+        # Skip no-op writes so rows restored from a copy-on-write snapshot stay shared.
+        if tuple(self.model.population.pos[self.idx]) != tuple(value):
+            self.model.population.pos[self.idx] = value
+
+    @property
+    def health_history(self):
+        """The agent's most recent vitals (at most HISTORY_LENGTH entries), oldest first."""
+        return self.model.population.agent_history(self.idx)
+
+    def move(self):
+        if self.is_dead:
+            return
+        x, y = self.pos
+        possible_moves = [
+            (x + dx, y + dy) for dx in [-1, 0, 1] for dy in [-1, 0, 1]
+            if (dx != 0 or dy != 0)
+            and 0 <= x + dx < self.model.grid.width
+            and 0 <= y + dy < self.model.grid.height
+        ]
+        # Filter out positions that contain a Wall
+        filtered_moves = [pos for pos in possible_moves if self.model.passable[pos]]
+        if filtered_moves:
+            new_position = self.random.choice(filtered_moves)
+            self.model.grid.move_agent(self, new_position)
+
+    @staticmethod
+    def batch_update_health_state(agents):
+        rows = np.sort(np.fromiter((agent.idx for agent in agents), dtype=np.intp, count=len(agents)))
+        agents[0].model.update_health_states(rows)
+
+    def set_dead_vitals(self):
+        self.model.population.set_latest(self.idx, DEAD_VITALS)
+
+    def step(self):
+        # check values of human to see if they are dead
+        if self.state == "critical":
+            self.critical_steps += 1
+            # self.health_history[-1][1] += 0.4  # Increase temperature
+            # self.critical_delay = 0
+        # elif self.critical_delay < 3:
+        #     self.critical_delay += 1
+        else:
+            self.critical_steps = 0  # reset if not critical
+            # self.critical_delay = 0
+
+        # Check if the person has been critical for more than 3 steps
+        # 145, 104, 24, 115.0
+        if self.is_dead:
+            return
+        if self.model.hospital_cells[self.pos] and not self.is_vaccinated:
+            self.is_vaccinated = True
+            if self.model.event_log is not None:
+                self.model.event_log.vaccinations(self.model, np.array([self.idx]))
+        self.move()
+
+
+class Hospital(Agent):
+    """A hospital where people can get vaccinated."""
+    def __init__(self, unique_id, model):
+        super().__init__(unique_id, model)
+
+class Wall(Agent):
+    """A hospital where people can get vaccinated."""
+    def __init__(self, unique_id, model):
+        super().__init__(unique_id, model)
+
+def create_enclosure(x1, y1, x2, y2, gate_positions=None):
+    walls = []
+    gate_positions = gate_positions or []
+
+    # Left and right walls
+    for y in range(y1, y2 + 1):
+        if (x1, y) not in gate_positions:
+            walls.append((x1, y))
+        if (x2, y) not in gate_positions:
+            walls.append((x2, y))
+
+    # Top and bottom walls
+    for x in range(x1 + 1, x2):
+        if (x, y1) not in gate_positions:
+            walls.append((x, y1))
+        if (x, y2) not in gate_positions:
+            walls.append((x, y2))
+
+    return walls
+
+
+# Corners (x1, y1, x2, y2) of the walled enclosure and its gates.
+ENCLOSURE = (7, 9, 13, 13)
+GATE_POSITIONS = [
+    (10, 13),
+    (7, 11),
+    (13, 10),
+]
+
+
+# Model reporters reading the population store's live counters in O(1).
+COUNTER_REPORTERS = {
+    "Healthy": lambda m: int(m.population.state_counts[STATE_CODES["healthy"]]),
+    "Infected": lambda m: int(m.population.state_counts[STATE_CODES["infected"]]),
+    "Critical": lambda m: int(m.population.state_counts[STATE_CODES["critical"]]),
+    "Chronic": lambda m: int(m.population.state_counts[STATE_CODES["chronic"]]),
+    "Vaccinated": lambda m: m.population.vaccinated_count,
+    "Dead": lambda m: m.population.dead_count,
+}
+
+# The same counts from a full scan of the agents, used to cross-check the counters.
+SCAN_REPORTERS = {
+    "Healthy": lambda m: sum(1 for a in m.schedule.agents if isinstance(a, Person) and a.state == "healthy" and not a.is_dead),
+    "Infected": lambda m: sum(1 for a in m.schedule.agents if isinstance(a, Person) and a.state == "infected" and not a.is_dead),
+    "Critical": lambda m: sum(1 for a in m.schedule.agents if isinstance(a, Person) and a.state == "critical" and not a.is_dead),
+    "Chronic": lambda m: sum(1 for a in m.schedule.agents if isinstance(a, Person) and a.state == "chronic" and not a.is_dead),
+    "Vaccinated": lambda m: sum(1 for a in m.schedule.agents if isinstance(a, Person) and a.is_vaccinated),
+    "Dead": lambda m: sum(1 for a in m.schedule.agents if isinstance(a, Person) and a.is_dead)
+}
+
+
+class PandemicModel(Model):
+    def __init__(self, width, height, N, num_hospitals=3, batched_moves=True, backend="keras", seed=None,
+                 debug_counters=False, recorder=None, vaccine_penalty=VACCINE_PENALTY,
+                 infected_neighbor_bonus=INFECTED_NEIGHBOR_BONUS, profile=False, adaptive=None, event_log=None):
+        # Model.__new__ seeds self.random from the seed keyword; every other random stream
+        # (numpy sampling, placement, scheduling) is derived from it so a seed reproduces a run.
+        self.grid = MultiGrid(width, height, torus=False)
+        self.schedule = RandomActivation(self)
+        self.batched_moves = batched_moves
+        self.backend = backend
+        self.vaccine_penalty = vaccine_penalty
+        self.infected_neighbor_bonus = infected_neighbor_bonus
+        self.np_random = np.random.default_rng(self.random.getrandbits(64))
+        self.population = PopulationStore(N)
+        self.people = []  # Person objects indexed by population row
+        # Walls and hospitals never move, so cell lookups for them go through these masks.
+        self.passable = np.ones((width, height), dtype=bool)
+        self.hospital_cells = np.zeros((width, height), dtype=bool)
+
+        wall_positions = create_enclosure(*ENCLOSURE, GATE_POSITIONS)
+
+        for idx, pos in enumerate(wall_positions):
+            wall = Wall(f"W{idx}", self)
+            self.grid.place_agent(wall, pos)
+            self.passable[pos] = False
+
+        # Hospitals and people each get their own cell, drawn from the empty cells in random order.
+        # (MultiGrid.find_empty would use the global random module.)
+        empty_cells = sorted(self.grid.empties)
+        self.random.shuffle(empty_cells)
+        if len(empty_cells) < num_hospitals + N:
+            raise ValueError(f"a {width}x{height} grid has only {len(empty_cells)} free cells "
+                             f"for {num_hospitals} hospitals and {N} people")
+
+        for i in range(num_hospitals):
+            x, y = empty_cells.pop()
+            hospital = Hospital(f"H{i}", self)
+            self.grid.place_agent(hospital, (x, y))
+            self.hospital_cells[x, y] = True
+            self.schedule.add(hospital)
+
+        for i in range(N):
+            person = Person(i, self)
+            self.people.append(person)
+            x, y = empty_cells.pop()
+            self.grid.place_agent(person, (x, y))
+            self.schedule.add(person)
+
+        self.debug_counters = debug_counters
+        self.recorder = recorder  # e.g. a trajectory.TrajectoryRecorder, fed after every step
+        self.adaptive = adaptive  # e.g. an adaptive.AdaptiveFidelity, to skip health predictions of stable agents
+        self.event_log = event_log  # e.g. an eventlog.EventLog, fed every transition, vaccination and death
+        self.profiler = StepProfiler(enabled=profile)
+        self.events = self.profiler.events  # structured event counters ("death", "vaccination")
+        reporters = dict(COUNTER_REPORTERS)
+        if profile:
+            reporters.update(profile_reporters())
+        self.datacollector = DataCollector(reporters)
+
+    def step(self):
+        profiler = self.profiler
+        profiler.start()
+        if self.batched_moves:
+            self.move_people()
+        else:
+            vaccinated = self.population.vaccinated_count
+            self.schedule.step()
+            self.events["vaccination"] += self.population.vaccinated_count - vaccinated
+        profiler.lap("move")
+        rows = self.population.live_rows()
+        if len(rows):
+            self.update_health_states(rows)
+        self.datacollector.collect(self)
+        if self.debug_counters:
+            self.check_counters()
+        if self.recorder is not None:
+            self.recorder.record(self)
+        profiler.lap("collect")
+
+    def check_counters(self):
+        """Compare the live counters against a full scan of the agents (debug mode)."""
+        for name, reporter in SCAN_REPORTERS.items():
+            expected, counted = reporter(self), COUNTER_REPORTERS[name](self)
+            if expected != counted:
+                raise RuntimeError(f"step {self.schedule.steps}: {name} counter is {counted}, full scan gives {expected}")
+
+    def move_people(self):
+        """Run Person.step for every person at once.
+
+        Walls and hospitals are static and people never block each other, so each move
+        only depends on the mover; drawing all moves together gives the same distribution
+        as activating the agents one by one in random order.
+        """
+        population = self.population
+        advance_critical_steps(population)
+
+        rows = population.live_rows()
+        pos = population.pos[rows]
+        vaccinated = population.set_vaccinated(rows[self.hospital_cells[pos[:, 0], pos[:, 1]]])
+        self.events["vaccination"] += len(vaccinated)
+        if self.event_log is not None:
+            self.event_log.vaccinations(self, vaccinated)
+
+        new_pos = random_moves(self.passable, pos, self.np_random)
+        for i in np.flatnonzero((new_pos != pos).any(axis=1)):
+            self.grid.move_agent(self.people[rows[i]], (int(new_pos[i, 0]), int(new_pos[i, 1])))
+        self.schedule.steps += 1
+        self.schedule.time += 1
+
+    def infected_neighbor_counts(self):
+        """Infected agents in the Moore neighbourhood of every agent, indexed by population row."""
+        population = self.population
+        return count_infected_neighbors(
+            self.grid.width, self.grid.height,
+            population.pos[:population.size],
+            population.state[:population.size] == INFECTED,
+        )
+
+    def update_health_states(self, rows):
+        """Advance health state and vitals of the live agents in rows (sorted, unique) by one step."""
+        advance_health(self, rows, self.infected_neighbor_counts()[rows])
+
+    def get_agent_details(self, unique_id=None):
+        """Full detail records of every person, or only of unique_id, keyed by unique_id."""
+        return agent_details(self.population, unique_id)
+
+
+def agent_details(population, unique_id=None):
+    """Detail records of the agents of a PopulationStore, or only of unique_id, keyed by unique_id."""
+    if unique_id is None:
+        rows = range(population.size)
+    else:
+        rows = np.flatnonzero(population.unique_id[:population.size] == unique_id)
+    details = {}
+    for row in rows:
+        x, y = population.pos[row]
+        history = population.agent_history(row)
+        details[int(population.unique_id[row])] = {
+            "state": STATE_NAMES[population.state[row]],
+            "vaccinated": bool(population.vaccinated[row]),
+            "dead": bool(population.dead[row]),
+            "current health": history[-1].tolist(),  # converts to native types
+            "position": None if x < 0 else (int(x), int(y)),
+            "health history": history.tolist(),
+        }
+    return details
@@ -0,0 +1,306 @@
+"""Record the web UI frames of a PandemicModel run and play them back without the models.
+
+A RunRecorder renders every recorded step with the visualization elements of
+pandemic_viz and appends the outputs to <directory>/frames.bin, one zlib-compressed
+JSON list per step, exactly as the browser receives them. AgentDetailElement is the
+exception: it sends only the agents that changed since the frame the browser saw last,
+which depends on where playback starts, so its input is stored instead. Each step
+appends the state, vaccination, death, position and latest vitals of every agent to
+<directory>/agents.bin, and full agent records (with the vitals history) are rebuilt
+from those on demand. index.npy holds the step, offsets and sizes of every frame.
+
+    python playback.py record runs/demo --N 300 --width 40 --height 40 --steps 200
+    python playback.py serve runs/demo
+
+or record from batch_runner.py with --record. The playback server shows the frames with
+the usual CanvasGrid, ChartModule and AgentDetailElement and never runs a model: "Start
+at step" seeks and "Steps per frame" fast-forwards, both applied on Reset. After a seek
+the chart starts at the seek step.
+"""
+import argparse
+import functools
+import json
+import os
+import types
+import zlib
+
+import numpy as np
+from mesa.visualization.UserParam import Slider
+
+from pandemic_model import agent_details
+from pandemic_viz import AgentDetailElement, PandemicServer, visualization_elements
+from population import NUM_VITALS, PopulationStore
+from snapshot import json_default
+
+FRAMES_FILE = "frames.bin"
+AGENTS_FILE = "agents.bin"
+INDEX_FILE = "index.npy"
+INITIAL_FILE = "initial.npz"   # unique ids and vitals history of the agents at the first frame
+MANIFEST = "manifest.json"
+
+# Elements rendered at playback from the stored agent arrays instead of being stored.
+LIVE_ELEMENTS = (AgentDetailElement,)
+
+AGENT_DTYPE = np.dtype([
+    ("state", "i1"),            # index into population.STATE_NAMES
+    ("vaccinated", "?"),
+    ("dead", "?"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("vitals", "<f4", (NUM_VITALS,)),
+])
+INDEX_DTYPE = np.dtype([
+    ("step", "<i4"),
+    ("frame_offset", "<i8"),
+    ("frame_size", "<i8"),
+    ("agents_offset", "<i8"),
+    ("agents_size", "<i8"),
+])
+
+
+class RunRecorder:
+    """Appends a frame per record(model) call; record once before the first step to keep the initial state."""
+
+    def __init__(self, directory, elements=None, level=6):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.elements = elements
+        self.level = level
+        self._frames = open(os.path.join(directory, FRAMES_FILE), "wb")
+        self._agents = open(os.path.join(directory, AGENTS_FILE), "wb")
+        self.index = []
+        self.manifest = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, model):
+        population = model.population
+        n = population.size
+        if self.manifest is None:
+            if self.elements is None:
+                self.elements = visualization_elements(model.grid.width, model.grid.height)
+            self._start(model)
+        elif n != self.manifest["agents"]:
+            raise ValueError("the population size changed during the recording")
+
+        outputs = [element.render(model) for element in self.elements if not isinstance(element, LIVE_ELEMENTS)]
+        frame = zlib.compress(json.dumps(outputs, separators=(",", ":"), default=json_default).encode(), self.level)
+        agents = np.empty(n, dtype=AGENT_DTYPE)
+        agents["state"] = population.state[:n]
+        agents["vaccinated"] = population.vaccinated[:n]
+        agents["dead"] = population.dead[:n]
+        agents["x"] = population.pos[:n, 0]
+        agents["y"] = population.pos[:n, 1]
+        agents["vitals"] = population.latest()
+        agents = zlib.compress(agents.tobytes(), self.level)
+
+        self.index.append((model.schedule.steps, self._frames.tell(), len(frame), self._agents.tell(), len(agents)))
+        self._frames.write(frame)
+        self._agents.write(agents)
+
+    def _start(self, model):
+        population = model.population
+        np.savez_compressed(os.path.join(self.directory, INITIAL_FILE),
+                            unique_id=population.unique_id[:population.size],
+                            history=population.history_window())
+        self.manifest = {
+            "width": model.grid.width,
+            "height": model.grid.height,
+            "agents": population.size,
+            "history_length": population.history_length,
+            "elements": [type(element).__name__ for element in self.elements if not isinstance(element, LIVE_ELEMENTS)],
+        }
+
+    def close(self):
+        if self._frames.closed:
+            return
+        self._frames.close()
+        self._agents.close()
+        np.save(os.path.join(self.directory, INDEX_FILE), np.array(self.index, dtype=INDEX_DTYPE))
+        manifest = dict(self.manifest or {}, frames=len(self.index))
+        with open(os.path.join(self.directory, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=1)
+
+
+def record_run(model, steps, directory, elements=None):
+    """Record the current state of model and each of its next steps."""
+    with RunRecorder(directory, elements) as recorder:
+        recorder.record(model)
+        for _ in range(steps):
+            model.step()
+            recorder.record(model)
+    return model
+
+
+class RecordedRun:
+    """Random access to the frames of a closed recording."""
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.width, self.height = self.manifest["width"], self.manifest["height"]
+        self.index = np.load(os.path.join(directory, INDEX_FILE))
+        self.steps = self.index["step"]
+        with np.load(os.path.join(directory, INITIAL_FILE)) as initial:
+            self.unique_id, self.initial_history = initial["unique_id"], initial["history"]
+        self._frames = open(os.path.join(directory, FRAMES_FILE), "rb")
+        self._agents = open(os.path.join(directory, AGENTS_FILE), "rb")
+        # Agent details read up to history_length consecutive agent frames
+        self.agents = functools.lru_cache(maxsize=self.manifest["history_length"] + 1)(self._read_agents)
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        self._frames.close()
+        self._agents.close()
+
+    def frame_at(self, step):
+        """Number of the first frame recorded at or after step."""
+        return min(int(np.searchsorted(self.steps, step)), len(self) - 1)
+
+    @staticmethod
+    def _read(f, offset, size):
+        f.seek(offset)
+        return zlib.decompress(f.read(size))
+
+    def outputs(self, frame):
+        """Recorded element outputs of a frame, in element order without LIVE_ELEMENTS."""
+        entry = self.index[frame]
+        return json.loads(self._read(self._frames, entry["frame_offset"], entry["frame_size"]))
+
+    def _read_agents(self, frame):
+        entry = self.index[frame]
+        return np.frombuffer(self._read(self._agents, entry["agents_offset"], entry["agents_size"]), dtype=AGENT_DTYPE)
+
+    def population(self, frame):
+        """A PopulationStore of a frame holding only the latest vitals (history_length 1)."""
+        agents = self.agents(frame)
+        arrays = {
+            "unique_id": self.unique_id,
+            "state": agents["state"],
+            "vaccinated": agents["vaccinated"],
+            "dead": agents["dead"],
+            "critical_steps": np.zeros(len(agents), dtype=np.int32),
+            "pos": np.stack([agents["x"], agents["y"]], axis=1),
+            "vitals": np.repeat(agents["vitals"][:, None], 2, axis=1),
+        }
+        return PopulationStore.from_arrays(arrays, head=0, length=1)
+
+    def history(self, frame, row):
+        """Vitals history of the agent in row at a frame, as PopulationStore.agent_history returns it."""
+        history_length = self.manifest["history_length"]
+        first = max(1, frame - history_length + 1)
+        latest = [self.agents(k)["vitals"][row] for k in range(first, frame + 1)]
+        history = np.concatenate([self.initial_history[row], np.reshape(latest, (-1, NUM_VITALS))])
+        return history[-min(len(self.initial_history[row]) + frame, history_length):]
+
+    def agent_details(self, frame, unique_id=None):
+        """agent_details() of a frame, with the full vitals history of every returned agent."""
+        rows = range(len(self.unique_id)) if unique_id is None else np.flatnonzero(self.unique_id == unique_id)
+        details = {}
+        for row in rows:
+            agents = self.agents(frame)[row:row + 1]
+            history = self.history(frame, row)
+            vitals = np.zeros((1, 2 * len(history), NUM_VITALS), dtype=np.float32)
+            vitals[0, :len(history)] = vitals[0, len(history):] = history
+            store = PopulationStore.from_arrays({
+                "unique_id": self.unique_id[row:row + 1],
+                "state": agents["state"],
+                "vaccinated": agents["vaccinated"],
+                "dead": agents["dead"],
+                "critical_steps": np.zeros(1, dtype=np.int32),
+                "pos": np.stack([agents["x"], agents["y"]], axis=1),
+                "vitals": vitals,
+            }, head=len(history) - 1, length=len(history))
+            details.update(agent_details(store))
+        return details
+
+
+class PlaybackModel:
+    """Stands in for PandemicModel in PlaybackServer: step() moves through the recorded frames.
+
+    Playback starts at the first frame recorded at or after start, and every step()
+    advances speed recorded steps.
+    """
+
+    def __init__(self, run, start=0, speed=1):
+        self.run = run
+        self.speed = max(1, int(speed))
+        self.frame = run.frame_at(start)
+        self.running = self.frame < len(run) - 1
+        self.schedule = types.SimpleNamespace(steps=int(run.steps[self.frame]))
+        self._population = None
+
+    def step(self):
+        self.frame = min(self.frame + self.speed, len(self.run) - 1)
+        self.schedule.steps = int(self.run.steps[self.frame])
+        self.running = self.frame < len(self.run) - 1
+        self._population = None
+
+    @property
+    def population(self):
+        if self._population is None:
+            self._population = self.run.population(self.frame)
+        return self._population
+
+    def get_agent_details(self, unique_id=None):
+        return self.run.agent_details(self.frame, unique_id)
+
+
+class PlaybackServer(PandemicServer):
+    """PandemicServer showing a RecordedRun; recorded outputs are sent as they were stored."""
+
+    def __init__(self, run, elements=None, name="Pandemic Digital Twin (playback)", max_speed=20):
+        elements = elements or visualization_elements(run.width, run.height)
+        recorded = [type(element).__name__ for element in elements if not isinstance(element, LIVE_ELEMENTS)]
+        if recorded != run.manifest["elements"]:
+            raise ValueError(f"the run was recorded with {run.manifest['elements']}, not {recorded}")
+        first, last = int(run.steps[0]), int(run.steps[-1])
+        params = {
+            "run": run,
+            "start": Slider("Start at step", first, first, last, 1),
+            "speed": Slider("Steps per frame", 1, 1, max_speed, 1),
+        }
+        super().__init__(PlaybackModel, elements, name, params)
+
+    def render_model(self):
+        recorded = iter(self.model.run.outputs(self.model.frame))
+        return [element.render(self.model) if isinstance(element, LIVE_ELEMENTS) else next(recorded)
+                for element in self.visualization_elements]
+
+
+def main(argv=None):
+    from batch_runner import DEFAULT_SCENARIO, build_model
+    from inference import ENGINES
+
+    parser = argparse.ArgumentParser(description="Record a PandemicModel run for the web UI, or play one back.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="run a scenario headless and record its frames")
+    record.add_argument("directory")
+    record.add_argument("--steps", type=int, default=DEFAULT_SCENARIO["steps"])
+    for key in ("width", "height", "N", "seed"):
+        record.add_argument(f"--{key}", type=int, default=DEFAULT_SCENARIO.get(key))
+    record.add_argument("--num-hospitals", type=int, default=DEFAULT_SCENARIO["num_hospitals"], dest="num_hospitals")
+    record.add_argument("--backend", choices=sorted(ENGINES), default=DEFAULT_SCENARIO.get("backend", "keras"))
+    serve = commands.add_parser("serve", help="serve a recording to the web UI")
+    serve.add_argument("directory")
+    serve.add_argument("--port", type=int, default=8527)
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        config = {key: getattr(args, key) for key in ("width", "height", "N", "num_hospitals", "backend", "seed")}
+        record_run(build_model(config), args.steps, args.directory)
+        print(f"recorded {args.steps + 1} frames to {args.directory}")
+    else:
+        server = PlaybackServer(RecordedRun(args.directory))
+        server.port = args.port
+        server.launch()
+
+
+if __name__ == "__main__":
+    main()
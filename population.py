@@ -0,0 +1,210 @@
+import numpy as np
+
+# Order of states as output by the parameter_model, followed by the terminal "dead" state.
+STATE_NAMES = ("healthy", "infected", "critical", "chronic", "dead")
+STATE_CODES = {name: code for code, name in enumerate(STATE_NAMES)}
+INFECTED = STATE_CODES["infected"]
+CRITICAL = STATE_CODES["critical"]
+DEAD = STATE_CODES["dead"]
+
+# Per-agent arrays of a PopulationStore, in the order they are declared.
+ARRAY_FIELDS = ("unique_id", "state", "vaccinated", "dead", "critical_steps", "pos", "vitals")
+
+HISTORY_LENGTH = 20  # longest vitals sequence fed to the models
+NUM_VITALS = 4       # blood pressure, temperature, respiratory rate, heart rate
+
+# Every person starts with INITIAL_HISTORY vitals entries drawn uniformly from these
+# ranges, except patient zero (unique_id 0), who starts critical with fixed vitals.
+INITIAL_HISTORY = 5
+INITIAL_VITALS_LOW = (80.0, 95.0, 8.0, 50.0)
+INITIAL_VITALS_HIGH = (140.0, 103.0, 23.0, 110.0)
+PATIENT_ZERO_VITALS = (145.0, 104.0, 24.0, 115.0)
+
+
+class PopulationStore:
+    """Struct-of-arrays storage for every Person of a PandemicModel.
+
+    Row i holds the state of one agent; Person objects only keep their row index.
+    Vitals live in a fixed ring buffer of HISTORY_LENGTH entries per agent. Every entry
+    is written twice, at slot and slot + HISTORY_LENGTH, so the most recent entries are
+    always contiguous and history_window() can return them as a view without copying.
+    """
+
+    def __init__(self, capacity, history_length=HISTORY_LENGTH):
+        self.capacity = capacity
+        self.history_length = history_length
+        self.size = 0
+        self.unique_id = np.zeros(capacity, dtype=np.int64)
+        self.state = np.zeros(capacity, dtype=np.int8)
+        self.vaccinated = np.zeros(capacity, dtype=bool)
+        self.dead = np.zeros(capacity, dtype=bool)
+        self.critical_steps = np.zeros(capacity, dtype=np.int32)
+        self.pos = np.full((capacity, 2), -1, dtype=np.int32)  # (-1, -1) while off the grid
+        self.vitals = np.zeros((capacity, 2 * history_length, NUM_VITALS), dtype=np.float32)
+        self.head = -1    # ring slot of the most recent entry
+        self.length = 0   # number of valid entries per agent, at most history_length
+        # Live counters kept in step with every state/vaccinated/dead change made through
+        # the methods below, so reporters can read them without scanning the population.
+        self.state_counts = np.zeros(len(STATE_NAMES), dtype=np.int64)
+        self.vaccinated_count = 0
+        self.dead_count = 0
+
+    @classmethod
+    def from_arrays(cls, arrays, head, length):
+        """A full store wrapping existing per-agent arrays without copying them.
+
+        arrays holds unique_id, state, vaccinated, dead, critical_steps, pos and vitals; the
+        counters are recomputed from them.
+        """
+        store = cls.__new__(cls)
+        store.capacity = store.size = len(arrays["unique_id"])
+        store.history_length = arrays["vitals"].shape[1] // 2
+        for name in ARRAY_FIELDS:
+            setattr(store, name, arrays[name])
+        store.head = head
+        store.length = length
+        state_counts, store.vaccinated_count, store.dead_count = store.scan_counts()
+        store.state_counts = state_counts.astype(np.int64)
+        return store
+
+    def add(self, unique_id, state, history):
+        """Append an agent with its initial vitals history and return its row."""
+        if self.size == self.capacity:
+            raise ValueError(f"population store is full ({self.capacity} agents)")
+        history = np.asarray(history, dtype=np.float32)[-self.history_length:]
+        if self.size == 0:
+            self.length = len(history)
+            self.head = self.length - 1
+        elif len(history) != self.length:
+            raise ValueError("all agents must start with the same number of history entries")
+
+        row = self.size
+        self.size += 1
+        self.unique_id[row] = unique_id
+        self.state[row] = STATE_CODES[state]
+        self.state_counts[self.state[row]] += 1
+        self.vitals[row, :self.length] = history
+        self.vitals[row, self.history_length:self.history_length + self.length] = history
+        return row
+
+    def extend(self, arrays):
+        """Append the agents of arrays (per-agent arrays of ARRAY_FIELDS) and return their rows.
+
+        Their vitals must use the ring slots of this store (the same head and length).
+        The arrays grow by half when they are full.
+        """
+        n = len(arrays["unique_id"])
+        if self.size + n > self.capacity:
+            self._grow(max(self.size + n, self.capacity + self.capacity // 2))
+        rows = np.arange(self.size, self.size + n)
+        for name in ARRAY_FIELDS:
+            getattr(self, name)[rows] = arrays[name]
+        self.size += n
+        self.state_counts += np.bincount(self.state[rows], minlength=len(STATE_NAMES))
+        self.vaccinated_count += int(np.count_nonzero(self.vaccinated[rows]))
+        self.dead_count += int(np.count_nonzero(self.dead[rows]))
+        return rows
+
+    def take(self, rows):
+        """Copies of the per-agent arrays of rows, in the form extend() accepts."""
+        return {name: getattr(self, name)[rows] for name in ARRAY_FIELDS}
+
+    def remove(self, rows):
+        """Remove the agents in rows, moving agents from the end of the store into their rows.
+
+        Returns (moved_from, moved_to): the agents that were in rows moved_from are now in
+        rows moved_to. Other agents keep their rows.
+        """
+        rows = np.unique(rows)
+        self.state_counts -= np.bincount(self.state[rows], minlength=len(STATE_NAMES))
+        self.vaccinated_count -= int(np.count_nonzero(self.vaccinated[rows]))
+        self.dead_count -= int(np.count_nonzero(self.dead[rows]))
+        size = self.size - len(rows)
+        moved_to = rows[rows < size]
+        moved_from = np.setdiff1d(np.arange(size, self.size), rows)
+        for name in ARRAY_FIELDS:
+            array = getattr(self, name)
+            array[moved_to] = array[moved_from]
+        self.size = size
+        return moved_from, moved_to
+
+    def _grow(self, capacity):
+        for name in ARRAY_FIELDS:
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def set_states(self, rows, codes):
+        rows = np.atleast_1d(rows)
+        codes = np.broadcast_to(np.asarray(codes, dtype=self.state.dtype), rows.shape)
+        # Only rows whose state changes are written, so untouched pages of a memory-mapped
+        # copy-on-write snapshot stay shared.
+        changed = self.state[rows] != codes
+        rows, codes = rows[changed], codes[changed]
+        self.state_counts -= np.bincount(self.state[rows], minlength=len(STATE_NAMES))
+        self.state[rows] = codes
+        self.state_counts += np.bincount(codes, minlength=len(STATE_NAMES))
+
+    def set_vaccinated(self, rows, value=True):
+        rows = np.atleast_1d(rows)
+        changed = rows[self.vaccinated[rows] != value]
+        self.vaccinated[changed] = value
+        self.vaccinated_count += len(changed) if value else -len(changed)
+        return changed
+
+    def set_dead(self, rows, value=True):
+        rows = np.atleast_1d(rows)
+        changed = rows[self.dead[rows] != value]
+        self.dead[changed] = value
+        self.dead_count += len(changed) if value else -len(changed)
+        return changed
+
+    def scan_counts(self):
+        """Recount state_counts, vaccinated_count and dead_count with a full pass."""
+        return (np.bincount(self.state[:self.size], minlength=len(STATE_NAMES)),
+                int(self.vaccinated[:self.size].sum()), int(self.dead[:self.size].sum()))
+
+    def history_window(self):
+        """(size, length, 4) view of the most recent vitals of every agent, oldest first."""
+        end = self.head + self.history_length + 1
+        return self.vitals[:self.size, end - self.length:end]
+
+    def agent_history(self, row):
+        return self.vitals[row, self.head + self.history_length + 1 - self.length:self.head + self.history_length + 1]
+
+    def latest(self):
+        """(size, 4) view of the most recent vitals of every agent."""
+        return self.vitals[:self.size, self.head]
+
+    def push(self, rows, values):
+        """Advance the history by one step, writing values for the given rows.
+
+        Rows that are not updated (e.g. dead agents) carry their previous vitals forward.
+        Carried rows are only written where the slot does not hold them already, so once
+        a dead agent's history is constant its rows are no longer touched.
+        """
+        new_head = (self.head + 1) % self.history_length
+        carried = np.ones(self.size, dtype=bool)
+        carried[rows] = False
+        latest = self.vitals[:self.size, self.head]
+        stale = np.flatnonzero(carried & (self.vitals[:self.size, new_head] != latest).any(axis=1))
+        for slot in (new_head, new_head + self.history_length):
+            self.vitals[stale, slot] = latest[stale]
+            self.vitals[rows, slot] = values
+        self.head = new_head
+        self.length = min(self.length + 1, self.history_length)
+
+    def set_latest(self, rows, values):
+        """Overwrite the most recent vitals of the given rows."""
+        self.vitals[rows, self.head] = values
+        self.vitals[rows, self.head + self.history_length] = values
+
+    def copy(self):
+        """An independent store holding a copy of the current agents."""
+        arrays = {name: getattr(self, name)[:self.size].copy() for name in ARRAY_FIELDS}
+        return PopulationStore.from_arrays(arrays, self.head, self.length)
+
+    def live_rows(self):
+        return np.flatnonzero(~self.dead[:self.size])
@@ -133,6 +133,7 @@ chart = ChartModule([
     {"Label": "Vaccinated", "Color": "pink"},
 ])
 
-server = ModularServer(PandemicModel, [grid, chart], "Pandemic Digital Twin", {"width": 20, "height": 20, "N": 100, "num_hospitals": 3})
-server.port = 8521
-server.launch()
+if __name__ == "__main__":
+    server = ModularServer(PandemicModel, [grid, chart], "Pandemic Digital Twin", {"width": 20, "height": 20, "N": 100, "num_hospitals": 3})
+    server.port = 8521
+    server.launch()
@@ -0,0 +1,95 @@
+"""Per-phase timers for PandemicModel.step.
+
+    model = PandemicModel(20, 20, 30, profile=True)
+    ...
+    print(model.profiler.to_json())
+    open("metrics.prom", "w").write(model.profiler.to_prometheus())
+
+Timers are off by default; a disabled profiler costs one attribute check per phase.
+"""
+import json
+import time
+from collections import Counter
+
+# Phases of one PandemicModel.step, in execution order.
+PHASES = ("move", "neighbors", "parameter_predict", "sampling", "health_predict", "check_death", "collect")
+
+
+class StepProfiler:
+    """Lap timer: start() at the beginning of a step, lap(phase) at the end of each phase."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.steps = 0
+        self.last = dict.fromkeys(PHASES, 0.0)    # seconds per phase in the most recent step
+        self.previous = dict.fromkeys(PHASES, 0.0)  # seconds per phase in the step before it
+        self.totals = dict.fromkeys(PHASES, 0.0)  # seconds per phase over all steps
+        self.events = Counter()  # simulation events ("death", "vaccination"), counted even when disabled
+        self._mark = 0.0
+
+    def reset(self):
+        """Clear the timers, e.g. after warm-up steps; event counters are kept."""
+        self.steps = 0
+        self.last = dict.fromkeys(PHASES, 0.0)
+        self.previous = dict.fromkeys(PHASES, 0.0)
+        self.totals = dict.fromkeys(PHASES, 0.0)
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.steps += 1
+        self.previous, self.last = self.last, dict.fromkeys(PHASES, 0.0)
+        self._mark = time.perf_counter()
+
+    def mark(self):
+        """Restart the running lap, leaving out the time since the last lap (e.g. waiting)."""
+        if self.enabled:
+            self._mark = time.perf_counter()
+
+    def lap(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.last[phase] += now - self._mark
+        self.totals[phase] += now - self._mark
+        self._mark = now
+
+    def summary(self):
+        steps = max(self.steps, 1)
+        return {
+            "steps": self.steps,
+            "phases": {phase: {"last": self.last[phase], "total": self.totals[phase],
+                               "mean": self.totals[phase] / steps} for phase in PHASES},
+            "events": dict(self.events),
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.summary(), **kwargs)
+
+    def to_prometheus(self, prefix="pandemic"):
+        """Prometheus text exposition of the phase totals, step count and event counters."""
+        lines = [
+            f"# HELP {prefix}_step_phase_seconds_total Time spent in each phase of PandemicModel.step.",
+            f"# TYPE {prefix}_step_phase_seconds_total counter",
+        ]
+        lines += [f'{prefix}_step_phase_seconds_total{{phase="{phase}"}} {self.totals[phase]:.9f}' for phase in PHASES]
+        lines += [
+            f"# HELP {prefix}_steps_total Profiled model steps.",
+            f"# TYPE {prefix}_steps_total counter",
+            f"{prefix}_steps_total {self.steps}",
+            f"# HELP {prefix}_events_total Simulation events by type.",
+            f"# TYPE {prefix}_events_total counter",
+        ]
+        lines += [f'{prefix}_events_total{{event="{event}"}} {count}' for event, count in sorted(self.events.items())]
+        return "\n".join(lines) + "\n"
+
+
+def profile_reporters():
+    """DataCollector model reporters exposing the per-phase seconds of each step.
+
+    Data collection runs inside the "collect" phase, before that phase is timed, so its
+    column holds the previous step's collection time (0.0 on the first step).
+    """
+    reporters = {f"seconds_{phase}": (lambda m, phase=phase: m.profiler.last[phase]) for phase in PHASES}
+    reporters["seconds_collect"] = lambda m: m.profiler.previous["collect"]
+    return reporters
@@ -0,0 +1,191 @@
+"""Reduced-precision storage of the exported model weights, with an accuracy gate.
+
+    python export_weights.py                # float32 weights, checked against Keras
+    python quantize.py [--steps 40] [--state-tolerance 0.05] [--vitals-tolerance 1.0]
+    python quantize.py --weights trial.npz --fp16-out trial_fp16.npz --int8-out trial_int8.npz
+
+quantize.py reads model_weights.npz and writes two variants for the numpy backend:
+
+- model_weights_fp16.npz ("numpy-fp16"): every weight rounded to float16;
+- model_weights_int8.npz ("numpy-int8"): LSTM and Dense kernels quantized to int8 with
+  one symmetric float32 scale per output channel; biases are stored as float16.
+
+The variants are storage-only: NumpyNetwork dequantizes them to float32 when it loads
+them, so inference runs the same float32 arithmetic at the same speed and with the same
+working memory as "numpy". Only the weight files are smaller (about half and a third of
+model_weights.npz). NumPy has no int8 or float16 matrix kernels that would be faster on
+CPUs, and the masked Keras LSTM does not convert to TFLite builtin ops.
+
+The Keras models are the reference. quantize.py first runs export_weights.check_parity
+on the float32 weights, then compares the outputs of each variant with the outputs of
+the Keras models on a calibration set of vitals histories taken from a simulated run,
+the distribution the models see in practice. Kernels that read the raw vitals are much
+more sensitive to int8 rounding than the rest, so the int8 export ranks the kernels by
+the error each one causes alone on the calibration set and keeps the most sensitive
+ones in float16 until the outputs are within the tolerances. A variant that still
+differs by more than the tolerances is not written and the export fails.
+
+    model = PandemicModel(40, 40, 800, backend="numpy-int8")
+"""
+import argparse
+import os
+
+import numpy as np
+
+from export_weights import check_parity
+from inference import (FP16_WEIGHTS_PATH, INT8_WEIGHTS_PATH, SCALE_PREFIX, WEIGHTS_PATH, KerasEngine, NumpyEngine,
+                       load_keras_models)
+
+QUANTIZED_WEIGHTS = ("kernel", "recurrent_kernel")
+
+
+def load_arrays(path=WEIGHTS_PATH):
+    with np.load(path) as weights:
+        return dict(weights)
+
+
+def quantize_fp16(arrays):
+    return {key: array.astype(np.float16) if array.dtype.kind == "f" else array for key, array in arrays.items()}
+
+
+def quantize_int8(arrays, keep_float=()):
+    """Symmetric int8 kernels with a float32 scale per output channel (last axis).
+
+    Kernels named in keep_float, and all other weights, are stored as float16.
+    """
+    quantized = quantize_fp16(arrays)
+    for key, array in arrays.items():
+        if key.rsplit(".", 1)[-1] not in QUANTIZED_WEIGHTS or key in keep_float:
+            continue
+        scale = np.abs(array).max(axis=0) / 127
+        scale[scale == 0] = 1.0
+        quantized[key] = np.clip(np.round(array / scale), -127, 127).astype(np.int8)
+        quantized[SCALE_PREFIX + key] = scale.astype(np.float32)
+    return quantized
+
+
+def calibration_set(steps=40, width=40, height=40, N=800, seed=0, arrays=None, max_per_step=200):
+    """Vitals histories and one-hot states of live agents, sampled over a simulated run.
+
+    The run uses the float32 weights (arrays, or model_weights.npz), which match the Keras
+    models within the export tolerance. Returns a list of (seq, states) batches, one per step.
+    """
+    from pandemic_model import PandemicModel
+
+    engine = NumpyEngine() if arrays is None else NumpyEngine(weights=arrays)
+    model = PandemicModel(width, height, N, backend=engine, seed=seed)
+    rng = np.random.default_rng(seed)
+    batches = []
+    for _ in range(steps):
+        model.step()
+        population = model.population
+        rows = population.live_rows()
+        if len(rows) == 0:
+            break
+        if len(rows) > max_per_step:
+            rows = np.sort(rng.choice(rows, max_per_step, replace=False))
+        seq = population.history_window()[rows].copy()
+        states = np.eye(4, dtype=np.float32)[population.state[rows]]
+        batches.append((seq, states))
+    return batches
+
+
+def reference_outputs(engine, batches):
+    """(states, vitals) outputs of the reference engine (the Keras models) for each calibration batch."""
+    return [(engine.predict_states(seq), engine.predict_vitals(seq, states)) for seq, states in batches]
+
+
+def accuracy_report(arrays, batches, expected):
+    """Differences between the outputs of a set of weights and the expected outputs on the calibration batches."""
+    engine = NumpyEngine(weights=arrays)
+    state_diffs, vitals_diffs, agree = [], [], []
+    for (seq, states), (expected_states, expected_vitals) in zip(batches, expected):
+        predicted_states = engine.predict_states(seq)
+        state_diffs.append(np.abs(predicted_states - expected_states))
+        agree.append(predicted_states.argmax(axis=1) == expected_states.argmax(axis=1))
+        vitals_diffs.append(np.abs(engine.predict_vitals(seq, states) - expected_vitals))
+    state_diffs, vitals_diffs = np.concatenate(state_diffs), np.concatenate(vitals_diffs)
+    return {
+        "samples": len(state_diffs),
+        "state_max_abs_diff": float(state_diffs.max()),
+        "state_mean_abs_diff": float(state_diffs.mean()),
+        "top_state_agreement": float(np.concatenate(agree).mean()),
+        "vitals_max_abs_diff": vitals_diffs.max(axis=0).tolist(),
+        "vitals_mean_abs_diff": vitals_diffs.mean(axis=0).tolist(),
+    }
+
+
+def error_ratio(report, state_tolerance, vitals_tolerance):
+    """Largest output difference of a report relative to its tolerance; at most 1 passes."""
+    return max(report["state_max_abs_diff"] / state_tolerance, max(report["vitals_max_abs_diff"]) / vitals_tolerance)
+
+
+def calibrate_int8(arrays, batches, expected, state_tolerance, vitals_tolerance):
+    """Kernels to keep in float16 so that the int8 export passes the tolerances.
+
+    Kernels are added most sensitive first, where the sensitivity of a kernel is the
+    error of quantizing only that kernel. Returns every kernel if nothing else passes.
+    """
+    kernels = [key for key in arrays if key.rsplit(".", 1)[-1] in QUANTIZED_WEIGHTS]
+    sensitivity = {}
+    for key in kernels:
+        report = accuracy_report(quantize_int8(arrays, set(kernels) - {key}), batches, expected)
+        sensitivity[key] = error_ratio(report, state_tolerance, vitals_tolerance)
+
+    keep_float = []
+    for key in sorted(kernels, key=sensitivity.get, reverse=True):
+        report = accuracy_report(quantize_int8(arrays, keep_float), batches, expected)
+        if error_ratio(report, state_tolerance, vitals_tolerance) <= 1:
+            break
+        keep_float.append(key)
+    return keep_float
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write reduced-precision weights for the numpy backend.")
+    parser.add_argument("--weights", default=WEIGHTS_PATH, help="float32 weights written by export_weights.py")
+    parser.add_argument("--fp16-out", default=FP16_WEIGHTS_PATH, dest="fp16_out", help="float16 variant to write")
+    parser.add_argument("--int8-out", default=INT8_WEIGHTS_PATH, dest="int8_out", help="int8 variant to write")
+    parser.add_argument("--steps", type=int, default=40, help="simulated steps of the calibration run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--state-tolerance", type=float, default=0.05, dest="state_tolerance",
+                        help="largest allowed absolute difference of a state probability")
+    parser.add_argument("--vitals-tolerance", type=float, default=1.0, dest="vitals_tolerance",
+                        help="largest allowed absolute difference of a predicted vital")
+    parser.add_argument("--parity-tolerance", type=float, default=1e-4, dest="parity_tolerance",
+                        help="largest allowed difference of the float32 weights from Keras, as in export_weights.py")
+    args = parser.parse_args(argv)
+
+    models = load_keras_models()
+    state_diff, vitals_diff = check_parity(args.weights, models)
+    print(f"{os.path.basename(args.weights)} vs Keras: states {state_diff:.2e}, vitals {vitals_diff:.2e}")
+    if max(state_diff, vitals_diff) > args.parity_tolerance:
+        raise SystemExit(f"{args.weights} differs from the Keras models by more than {args.parity_tolerance}, "
+                         f"run export_weights.py")
+
+    arrays = load_arrays(args.weights)
+    batches = calibration_set(args.steps, seed=args.seed, arrays=arrays)
+    expected = reference_outputs(KerasEngine(*models), batches)
+    keep_float = calibrate_int8(arrays, batches, expected, args.state_tolerance, args.vitals_tolerance)
+    print(f"int8 kernels kept in float16: {', '.join(keep_float) or 'none'}")
+
+    print(f"{os.path.basename(args.weights)}: {os.path.getsize(args.weights)} bytes")
+    failed = []
+    for path, quantized in ((args.fp16_out, quantize_fp16(arrays)), (args.int8_out, quantize_int8(arrays, keep_float))):
+        # Variants are gated before they are written, so a failing one never replaces a working file.
+        report = accuracy_report(quantized, batches, expected)
+        passed = error_ratio(report, args.state_tolerance, args.vitals_tolerance) <= 1
+        if passed:
+            np.savez_compressed(path, **quantized)
+            print(f"{os.path.basename(path)}: {os.path.getsize(path)} bytes")
+        else:
+            failed.append(path)
+            print(f"{os.path.basename(path)}: failed the accuracy gate, not written")
+        for key, value in report.items():
+            print(f"  {key}: {np.round(value, 5).tolist() if isinstance(value, list) else value}")
+    if failed:
+        raise SystemExit(f"outputs for {', '.join(failed)} differ from Keras by more than the tolerances")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""Spatially sharded PandemicModel for very large grids.
+
+The grid is cut into vertical strips of columns, one per worker process. Each shard
+keeps the agents of its strip in its own PopulationStore and runs the movement and
+health phases of PandemicModel.step for them. A step takes three rounds through the
+coordinator:
+
+1. move:   every shard moves its agents; agents that cross a strip border are
+           returned as migrants and forwarded to the shard that now owns them.
+2. absorb: shards take in their migrants and return the infected-agent counts of
+           their first and last column (their halo for the neighbouring shards).
+3. health: shards count infected neighbours using the halo columns, run both
+           models and death checks, and return their counters, which the
+           coordinator sums into the usual DataCollector reporters.
+
+    with ShardedModel(2000, 2000, 1_000_000, shards=8, seed=1) as model:
+        for _ in range(50):
+            model.step()
+        print(model.datacollector.get_model_vars_dataframe())
+
+Each shard draws from its own random stream, so a sharded run has the same dynamics
+as PandemicModel but is not bit-identical to it. The "numpy" backend is the one to
+use here (export_weights.py); with many shards per node, set OMP_NUM_THREADS=1 so
+the workers do not oversubscribe the cores.
+"""
+import argparse
+import multiprocessing
+import time
+import traceback
+import types
+
+import numpy as np
+
+from mesa.datacollection import DataCollector
+from inference import ENGINES
+from pandemic_model import (COUNTER_REPORTERS, ENCLOSURE, GATE_POSITIONS, INFECTED_NEIGHBOR_BONUS, VACCINE_PENALTY,
+                            advance_critical_steps, advance_health, create_enclosure, states_order_param)
+from population import (CRITICAL, HISTORY_LENGTH, INFECTED, INITIAL_HISTORY, INITIAL_VITALS_HIGH, INITIAL_VITALS_LOW,
+                        NUM_VITALS, PATIENT_ZERO_VITALS, PopulationStore)
+from profiling import PHASES, StepProfiler
+from spatial import moore_sum, occupancy, random_moves
+
+
+def strip_bounds(width, shards):
+    """First column of each of shards nearly equal strips, followed by width."""
+    if not 1 <= shards <= width:
+        raise ValueError(f"cannot cut a grid of width {width} into {shards} strips")
+    return [width * k // shards for k in range(shards + 1)]
+
+
+def initial_population(n, first_id, cells, height, rng, history_length=HISTORY_LENGTH):
+    """Per-agent arrays for n new people placed on the given flat cell indices.
+
+    States and vitals are drawn as in Person.__init__; the person with unique_id 0 starts
+    critical with fixed vitals.
+    """
+    vitals = np.zeros((n, 2 * history_length, NUM_VITALS), dtype=np.float32)
+    history = rng.uniform(INITIAL_VITALS_LOW, INITIAL_VITALS_HIGH, size=(n, INITIAL_HISTORY, NUM_VITALS))
+    unique_id = np.arange(first_id, first_id + n, dtype=np.int64)
+    state = rng.integers(0, len(states_order_param), size=n).astype(np.int8)
+    zero = unique_id == 0
+    history[zero] = PATIENT_ZERO_VITALS
+    state[zero] = CRITICAL
+    vitals[:, :INITIAL_HISTORY] = history
+    vitals[:, history_length:history_length + INITIAL_HISTORY] = history
+    return {
+        "unique_id": unique_id,
+        "state": state,
+        "vaccinated": np.zeros(n, dtype=bool),
+        "dead": np.zeros(n, dtype=bool),
+        "critical_steps": np.zeros(n, dtype=np.int32),
+        "pos": np.stack([cells // height, cells % height], axis=1).astype(np.int32),
+        "vitals": vitals,
+    }
+
+
+class Shard:
+    """The agents of columns x0..x1-1 of the grid and the phases that advance them.
+
+    The health phase is pandemic_model.advance_health, so a shard has the attributes it
+    reads. There is no event log: a shard cannot see the contacts across its borders.
+    """
+
+    def __init__(self, index, bounds, height, passable, hospital_cells, n, first_id, seed, backend="numpy",
+                 vaccine_penalty=VACCINE_PENALTY, infected_neighbor_bonus=INFECTED_NEIGHBOR_BONUS, profile=False,
+                 adaptive=None):
+        self.index = index
+        self.bounds = np.asarray(bounds)
+        self.x0, self.x1 = bounds[index], bounds[index + 1]
+        self.height = height
+        self.backend = backend
+        self.vaccine_penalty = vaccine_penalty
+        self.infected_neighbor_bonus = infected_neighbor_bonus
+        self.np_random = np.random.default_rng(seed)
+        # passable holds the strip plus one column on each side (False beyond the grid).
+        self.passable = passable
+        self.hospital_cells = hospital_cells
+        self.adaptive = adaptive  # e.g. an adaptive.AdaptiveFidelity; every shard has its own copy
+        self.event_log = None
+        self.profiler = StepProfiler(enabled=profile)
+        self.events = self.profiler.events
+        self.schedule = types.SimpleNamespace(steps=0)
+
+        free = np.flatnonzero(passable[1:-1] & ~hospital_cells)
+        cells = np.sort(self.np_random.choice(free, size=n, replace=False)) + self.x0 * height
+        self.population = PopulationStore.from_arrays(
+            initial_population(n, first_id, cells, height, self.np_random), INITIAL_HISTORY - 1, INITIAL_HISTORY)
+
+    def move(self):
+        """Movement phase; returns {shard index: arrays} of the agents that left the strip."""
+        population = self.population
+        self.profiler.start()
+        advance_critical_steps(population)
+
+        rows = population.live_rows()
+        pos = population.pos[rows]
+        at_hospital = self.hospital_cells[pos[:, 0] - self.x0, pos[:, 1]]
+        self.events["vaccination"] += len(population.set_vaccinated(rows[at_hospital]))
+
+        offset = np.array([self.x0 - 1, 0], dtype=pos.dtype)
+        population.pos[rows] = random_moves(self.passable, pos - offset, self.np_random) + offset
+        self.schedule.steps += 1
+
+        # Agents that left the strip are taken out in place; agents from the end of the
+        # store fill their rows.
+        owner = np.searchsorted(self.bounds, population.pos[:population.size, 0], side="right") - 1
+        leaving = np.flatnonzero(owner != self.index)
+        migrants = {int(shard): population.take(leaving[owner[leaving] == shard]) for shard in np.unique(owner[leaving])}
+        if len(leaving):
+            moved_from, moved_to = population.remove(leaving)
+            if self.adaptive is not None:
+                self.adaptive.move_rows(moved_from, moved_to)
+        self.profiler.lap("move")
+        return migrants
+
+    def absorb(self, migrants):
+        """Add migrants from other shards; returns the infected counts of the first and last column."""
+        # Laps only time the shard's own work, not the time between its rounds.
+        self.profiler.mark()
+        for arrays in migrants:
+            rows = self.population.extend(arrays)
+            if self.adaptive is not None:
+                self.adaptive.forget_rows(rows)
+        self.profiler.lap("move")
+        infected = self._infected_occupancy()
+        return infected[0], infected[-1]
+
+    def health(self, left_halo, right_halo):
+        """Health phase for the live agents, given the neighbouring shards' edge columns."""
+        population = self.population
+        self.profiler.mark()
+        rows = population.live_rows()
+        if len(rows):
+            infected = self._infected_occupancy()
+            halo = [np.zeros(self.height, dtype=infected.dtype) if column is None else column
+                    for column in (left_halo, right_halo)]
+            counts = moore_sum(np.concatenate([halo[0][None], infected, halo[1][None]]))[1:-1]
+            pos = population.pos[rows]
+            advance_health(self, rows, counts[pos[:, 0] - self.x0, pos[:, 1]])
+        else:
+            # Migrants carry their vitals ring, so every shard advances its head every step.
+            population.push(rows, np.empty((0, NUM_VITALS), dtype=np.float32))
+        return self.counts()
+
+    def counts(self):
+        population = self.population
+        return {"size": population.size, "state_counts": population.state_counts.copy(),
+                "vaccinated": population.vaccinated_count, "dead": population.dead_count, "events": dict(self.events),
+                "phases": dict(self.profiler.totals)}
+
+    def arrays(self, fields=("unique_id", "state", "vaccinated", "dead", "pos")):
+        population = self.population
+        return {name: getattr(population, name)[:population.size].copy() for name in fields}
+
+    def _infected_occupancy(self):
+        population = self.population
+        pos = population.pos[:population.size] - np.array([self.x0, 0], dtype=np.int32)
+        return occupancy(self.x1 - self.x0, self.height, pos, population.state[:population.size] == INFECTED)
+
+
+def _serve_shard(conn, kwargs):
+    """Worker process loop: build a Shard, then run (method, args) commands until None."""
+    try:
+        shard = Shard(**kwargs)
+        conn.send(("ok", None))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+        return
+    while True:
+        command = conn.recv()
+        if command is None:
+            return
+        method, args = command
+        try:
+            conn.send(("ok", getattr(shard, method)(*args)))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+
+class ShardCounts:
+    """Summed shard counters, shaped like the PopulationStore attributes COUNTER_REPORTERS read."""
+
+    def __init__(self, parts):
+        self.size = sum(part["size"] for part in parts)
+        self.state_counts = sum(part["state_counts"] for part in parts)
+        self.vaccinated_count = sum(part["vaccinated"] for part in parts)
+        self.dead_count = sum(part["dead"] for part in parts)
+
+
+class ShardedModel:
+    """Coordinator of a PandemicModel run split over shards worker processes.
+
+    With processes=False the shards run one after another in this process, which is
+    useful for debugging and gives the same results as the same seed with processes.
+    profile and adaptive are passed to every shard; with profile, phase_seconds holds
+    the time of each phase summed over all shards.
+    """
+
+    def __init__(self, width, height, N, num_hospitals=3, shards=None, backend="numpy", seed=None,
+                 vaccine_penalty=VACCINE_PENALTY, infected_neighbor_bonus=INFECTED_NEIGHBOR_BONUS, processes=True,
+                 profile=False, adaptive=None):
+        shards = shards or multiprocessing.cpu_count()
+        self.width = width
+        self.height = height
+        self.N = N
+        self.bounds = strip_bounds(width, shards)
+        self.steps = 0
+        seeds = np.random.SeedSequence(seed).spawn(shards + 1)
+        rng = np.random.default_rng(seeds[0])
+
+        self.passable = np.ones((width, height), dtype=bool)
+        for pos in create_enclosure(*ENCLOSURE, GATE_POSITIONS):
+            self.passable[pos] = False
+        self.hospital_cells = np.zeros((width, height), dtype=bool)
+        free = np.flatnonzero(self.passable)
+        if len(free) < num_hospitals + N:
+            raise ValueError(f"a {width}x{height} grid has only {len(free)} free cells "
+                             f"for {num_hospitals} hospitals and {N} people")
+        self.hospital_cells.flat[rng.choice(free, size=num_hospitals, replace=False)] = True
+
+        # People per strip: N distinct free cells drawn over the whole grid, counted per strip.
+        free_cells = self.passable & ~self.hospital_cells
+        free_per_strip = [int(free_cells[x0:x1].sum()) for x0, x1 in zip(self.bounds, self.bounds[1:])]
+        per_strip = rng.multivariate_hypergeometric(free_per_strip, N)
+        first_ids = np.concatenate([[0], np.cumsum(per_strip)[:-1]])
+
+        padded = np.pad(self.passable, ((1, 1), (0, 0)), constant_values=False)
+        configs = []
+        for k in range(shards):
+            x0, x1 = self.bounds[k], self.bounds[k + 1]
+            configs.append({
+                "index": k, "bounds": self.bounds, "height": height,
+                "passable": padded[x0:x1 + 2].copy(), "hospital_cells": self.hospital_cells[x0:x1].copy(),
+                "n": int(per_strip[k]), "first_id": int(first_ids[k]), "seed": seeds[k + 1], "backend": backend,
+                "vaccine_penalty": vaccine_penalty, "infected_neighbor_bonus": infected_neighbor_bonus,
+                "profile": profile, "adaptive": adaptive,
+            })
+
+        self.processes = processes
+        self._workers = []
+        self._conns = []
+        if processes:
+            context = multiprocessing.get_context("spawn")
+            for config in configs:
+                parent, child = context.Pipe()
+                worker = context.Process(target=_serve_shard, args=(child, config), daemon=True)
+                worker.start()
+                self._workers.append(worker)
+                self._conns.append(parent)
+            for conn in self._conns:
+                self._result(conn.recv())
+        else:
+            self._shards = [Shard(**config) for config in configs]
+
+        self.population = ShardCounts(self._call("counts", [()] * shards))
+        self.events = {"death": 0, "vaccination": 0}
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.datacollector = DataCollector(dict(COUNTER_REPORTERS))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for conn in self._conns:
+            conn.send(None)
+        for worker in self._workers:
+            worker.join()
+        self._conns = []
+        self._workers = []
+
+    def step(self):
+        shards = len(self.bounds) - 1
+        migrants = self._call("move", [()] * shards)
+        inbound = [[] for _ in range(shards)]
+        for outbound in migrants:
+            for k, arrays in outbound.items():
+                inbound[k].append(arrays)
+
+        edges = self._call("absorb", [(arrays,) for arrays in inbound])
+        halos = [(edges[k - 1][1] if k > 0 else None, edges[k + 1][0] if k < shards - 1 else None)
+                 for k in range(shards)]
+        counts = self._call("health", halos)
+
+        self.population = ShardCounts(counts)
+        self.events = {name: sum(part["events"].get(name, 0) for part in counts) for name in self.events}
+        self.phase_seconds = {phase: sum(part["phases"][phase] for part in counts) for phase in PHASES}
+        self.steps += 1
+        self.datacollector.collect(self)
+
+    def gather(self, fields=("unique_id", "state", "vaccinated", "dead", "pos")):
+        """Per-agent arrays of every shard, merged and sorted by unique_id."""
+        parts = self._call("arrays", [(fields,)] * (len(self.bounds) - 1))
+        arrays = {name: np.concatenate([part[name] for part in parts]) for name in fields}
+        order = np.argsort(arrays["unique_id"]) if "unique_id" in arrays else slice(None)
+        return {name: values[order] for name, values in arrays.items()}
+
+    def _call(self, method, args):
+        """Run method with args[k] on every shard k and return the results in shard order."""
+        if not self.processes:
+            return [getattr(shard, method)(*shard_args) for shard, shard_args in zip(self._shards, args)]
+        for conn, shard_args in zip(self._conns, args):
+            conn.send((method, shard_args))
+        return [self._result(conn.recv()) for conn in self._conns]
+
+    @staticmethod
+    def _result(message):
+        status, value = message
+        if status == "error":
+            raise RuntimeError(f"shard worker failed:\n{value}")
+        return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a sharded PandemicModel on a large grid.")
+    parser.add_argument("--width", type=int, default=1000)
+    parser.add_argument("--height", type=int, default=1000)
+    parser.add_argument("--N", type=int, default=100_000)
+    parser.add_argument("--num-hospitals", type=int, default=3, dest="num_hospitals")
+    parser.add_argument("--shards", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--backend", choices=sorted(ENGINES), default="numpy")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--out", help="write the DataCollector series to this CSV file")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with ShardedModel(args.width, args.height, args.N, args.num_hospitals, args.shards, args.backend,
+                      args.seed) as model:
+        print(f"{len(model.bounds) - 1} shards ready in {time.perf_counter() - start:.2f}s")
+        for _ in range(args.steps):
+            start = time.perf_counter()
+            model.step()
+            print(f"step {model.steps}: {time.perf_counter() - start:.2f}s, dead {model.population.dead_count}")
+        results = model.datacollector.get_model_vars_dataframe()
+    results.index.name = "step"
+    if args.out:
+        results.to_csv(args.out)
+    else:
+        print(results.to_string())
+
+
+if __name__ == "__main__":
+    main()
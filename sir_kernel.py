@@ -0,0 +1,214 @@
+"""Vectorized NumPy version of the rule-based model in prev.py.
+
+SIRKernel applies the rules of prev.Person.step to the whole population at once:
+
+- an infected person's timer grows by one; past a recovery time drawn from 8..12 it
+  dies with probability 0.2 and recovers otherwise;
+- a healthy person with an infected person in its Moore neighbourhood (own cell
+  included) becomes infected with probability 0.3, a recovered one with probability
+  exp(-timer / 10);
+- everyone alive moves to a random neighbouring cell without a dead person on it;
+- healthy and recovered people standing on a hospital afterwards get vaccinated.
+
+prev.py activates people one at a time in random order, so a person infected early
+in a step can infect others later in the same step. The kernel keeps that effect by
+activating the shuffled population in `groups` batches: each batch sees the states and
+positions left by the batches before it. With groups=1 the whole population updates
+synchronously, which underestimates the spread noticeably; 8 groups match the agent
+model within sampling error. The kernel is a fast surrogate for parameter sweeps, not
+a bit-exact copy; compare() measures how close the two are:
+
+    python sir_kernel.py --width 20 --height 20 --N 100 --steps 60 --replicas 50
+"""
+import argparse
+import random
+
+import numpy as np
+import pandas as pd
+
+from mesa.datacollection import DataCollector
+from spatial import MOORE_OFFSETS, occupancy, random_moves
+
+SIR_STATES = ("healthy", "infected", "recovered", "dead", "vaccinated")
+HEALTHY, INFECTED, RECOVERED, DEAD, VACCINATED = range(len(SIR_STATES))
+REPORTERS = ("Healthy", "Infected", "Recovered", "Dead", "Vaccinated")
+
+# Rule parameters of prev.py
+INFECTION_PROB = 0.3
+RECOVERY_STEPS = (8, 12)    # recovery time, drawn uniformly (inclusive) every step
+MORTALITY = 0.2
+REINFECTION_SCALE = 10      # reinfection probability is exp(-infection_timer / REINFECTION_SCALE)
+INITIAL_VACCINATED = 0.1
+INITIAL_INFECTED = 0.05     # of the people not vaccinated
+
+ACTIVATION_GROUPS = 8       # batches of the random activation order per step
+
+
+def neighbourhood_count(counts, pos):
+    """Sum of counts over the Moore neighbourhood, own cell included, of every position.
+
+    Only the cells around pos are read, instead of summing the whole grid as
+    spatial.moore_sum does.
+    """
+    padded = np.pad(counts, 1)
+    x, y = pos[:, 0] + 1, pos[:, 1] + 1
+    total = padded[x, y].copy()
+    for dx, dy in MOORE_OFFSETS:
+        total += padded[x + dx, y + dy]
+    return total
+
+
+class SIRKernel:
+    """The prev.py PandemicModel as arrays: state, infection_timer and pos per person."""
+
+    def __init__(self, width, height, N, num_hospitals=3, seed=None, infection_prob=INFECTION_PROB,
+                 recovery_steps=RECOVERY_STEPS, mortality=MORTALITY, reinfection_scale=REINFECTION_SCALE,
+                 initial_vaccinated=INITIAL_VACCINATED, initial_infected=INITIAL_INFECTED, groups=ACTIVATION_GROUPS):
+        if num_hospitals + N > width * height:
+            raise ValueError(f"a {width}x{height} grid has only {width * height} cells "
+                             f"for {num_hospitals} hospitals and {N} people")
+        self.width = width
+        self.height = height
+        self.infection_prob = infection_prob
+        self.recovery_steps = recovery_steps
+        self.mortality = mortality
+        self.reinfection_scale = reinfection_scale
+        self.groups = groups
+        self.rng = np.random.default_rng(seed)
+        self.steps = 0
+
+        # Hospitals and people each start on their own cell, as with MultiGrid.find_empty.
+        cells = self.rng.choice(width * height, size=num_hospitals + N, replace=False)
+        self.hospital_cells = np.zeros((width, height), dtype=bool)
+        self.hospital_cells.flat[cells[:num_hospitals]] = True
+        self.pos = np.stack([cells[num_hospitals:] // height, cells[num_hospitals:] % height], axis=1)
+
+        self.state = np.full(N, HEALTHY, dtype=np.int8)
+        vaccinated = self.rng.random(N) < initial_vaccinated
+        self.state[vaccinated] = VACCINATED
+        self.state[~vaccinated & (self.rng.random(N) < initial_infected)] = INFECTED
+        self.infection_timer = np.zeros(N, dtype=np.int32)
+
+        self.datacollector = DataCollector({
+            name: (lambda m, code=code: int(np.count_nonzero(m.state == code)))
+            for code, name in enumerate(REPORTERS)
+        })
+
+    def step(self):
+        # Counts are collected before the step, as in prev.PandemicModel.step
+        self.datacollector.collect(self)
+        order = self.rng.permutation(len(self.state))
+        for group in np.array_split(order, min(self.groups, max(len(order), 1))):
+            self._activate(group)
+        self.steps += 1
+
+    def _activate(self, rows):
+        """Apply Person.step to rows at once, seeing everyone else's current state and position."""
+        rng = self.rng
+        n = len(rows)
+        state = self.state[rows]
+        timer = self.infection_timer[rows]
+
+        infected = state == INFECTED
+        timer[infected] += 1
+        low, high = self.recovery_steps
+        recovering = infected & (timer > rng.integers(low, high + 1, size=n))
+        dies = rng.random(n) < self.mortality
+        state[recovering & dies] = DEAD
+        state[recovering & ~dies] = RECOVERED
+        self.state[rows] = state
+        self.infection_timer[rows] = timer
+
+        # Infected people in the Moore neighbourhood, own cell included
+        pos = self.pos[rows]
+        exposed = neighbourhood_count(occupancy(self.width, self.height, self.pos, self.state == INFECTED), pos) > 0
+        u = rng.random(n)
+        infect = exposed & (((state == HEALTHY) & (u < self.infection_prob))
+                            | ((state == RECOVERED) & (u < np.exp(-timer / self.reinfection_scale))))
+        state[infect] = INFECTED
+
+        alive = state != DEAD
+        free = occupancy(self.width, self.height, self.pos, self.state == DEAD) == 0
+        pos[alive] = random_moves(free, pos[alive], rng)
+
+        at_hospital = self.hospital_cells[pos[:, 0], pos[:, 1]]
+        state[at_hospital & ((state == HEALTHY) | (state == RECOVERED))] = VACCINATED
+        self.state[rows] = state
+        self.pos[rows] = pos
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.step()
+        return self.datacollector.get_model_vars_dataframe()
+
+
+def prev_model(width, height, N, num_hospitals=3, seed=None):
+    """A prev.PandemicModel whose whole run is determined by seed."""
+    import prev
+    # prev.py draws initial states and cells from the global random module and moves with model.random
+    random.seed(seed)
+    model = prev.PandemicModel(width, height, N, num_hospitals)
+    model.reset_randomizer(seed)
+    return model
+
+
+def run_agent_model(width, height, N, num_hospitals=3, steps=60, seed=None):
+    """DataCollector series of the agent-based prev.PandemicModel for one seeded run."""
+    model = prev_model(width, height, N, num_hospitals, seed)
+    for _ in range(steps):
+        model.step()
+    return model.datacollector.get_model_vars_dataframe()
+
+
+def compare(width=20, height=20, N=100, num_hospitals=3, steps=60, replicas=50, seed=0, groups=ACTIVATION_GROUPS):
+    """Per-step mean and standard error of every reporter for the kernel and prev.py.
+
+    Returns a DataFrame indexed by (reporter, step) with the two means, their difference
+    and the difference in units of its standard error (z); |z| staying below about 3
+    means the kernel is statistically indistinguishable from the agent model at this
+    number of replicas.
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(2 * replicas)
+    runs = {
+        "kernel": [SIRKernel(width, height, N, num_hospitals, seed=int(s), groups=groups).run(steps) for s in seeds[:replicas]],
+        "agents": [run_agent_model(width, height, N, num_hospitals, steps, seed=int(s)) for s in seeds[replicas:]],
+    }
+    stats = {}
+    for name, series in runs.items():
+        values = np.stack([run[list(REPORTERS)].to_numpy(dtype=float) for run in series])
+        stats[name] = (values.mean(axis=0), values.std(axis=0, ddof=1) / np.sqrt(replicas))
+
+    rows = []
+    for i, reporter in enumerate(REPORTERS):
+        for step in range(steps):
+            kernel_mean, kernel_se = stats["kernel"][0][step, i], stats["kernel"][1][step, i]
+            agents_mean, agents_se = stats["agents"][0][step, i], stats["agents"][1][step, i]
+            se = np.hypot(kernel_se, agents_se)
+            diff = kernel_mean - agents_mean
+            rows.append((reporter, step, kernel_mean, agents_mean, diff, diff / se if se > 0 else 0.0))
+    return pd.DataFrame(rows, columns=["reporter", "step", "kernel", "agents", "difference", "z"]).set_index(
+        ["reporter", "step"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the vectorized SIR kernel with the agent model in prev.py.")
+    parser.add_argument("--width", type=int, default=20)
+    parser.add_argument("--height", type=int, default=20)
+    parser.add_argument("--N", type=int, default=100)
+    parser.add_argument("--num-hospitals", type=int, default=3, dest="num_hospitals")
+    parser.add_argument("--steps", type=int, default=60)
+    parser.add_argument("--replicas", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--groups", type=int, default=ACTIVATION_GROUPS, help="activation batches of the kernel per step")
+    args = parser.parse_args(argv)
+
+    result = compare(args.width, args.height, args.N, args.num_hospitals, args.steps, args.replicas, args.seed,
+                     args.groups)
+    summary = result.groupby(level="reporter").agg(
+        max_abs_difference=("difference", lambda d: d.abs().max()), max_abs_z=("z", lambda z: z.abs().max()))
+    print(summary.to_string())
+    print(result.xs(args.steps - 1, level="step").to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Snapshots of a running PandemicModel and copy-on-write scenario forking.
+
+A snapshot holds everything needed to continue a run: the population store (every
+Person field, including the vitals history), grid layout, schedule counters, both
+random number generator states, the DataCollector series, the event counters and the
+profiler timers.
+
+    snap = take_snapshot(model)                      # in memory
+    save_snapshot(snap, "snapshots/step50")          # directory of .npy files + meta.json
+    snap = load_snapshot("snapshots/step50")         # arrays memory-mapped copy-on-write
+    branches = fork(snap, [{}, {"vaccine_penalty": 3.0}, {"add_hospitals": [(2, 2)]}])
+
+Snapshots loaded from disk memory-map their arrays in copy-on-write mode, so restoring a
+branch reads nothing up front and branches share the pages of the files until they
+write to them. Every step pushes new vitals for every live agent, so by its first step
+a branch holds a private copy of nearly all of vitals.npy, the bulk of a snapshot (12.2
+of 12.8 MB of arrays for 20000 agents, in every branch). What stays shared is the
+static data (walls, ids) and the rows and pages that the branch never changes.
+"""
+import json
+import os
+
+import numpy as np
+
+from inference import engine_name
+from pandemic_model import Hospital, PandemicModel, Person
+from population import ARRAY_FIELDS, PopulationStore
+
+META_FILE = "meta.json"
+
+# Model arguments that a branch may override when it is restored.
+MODEL_OVERRIDES = ("batched_moves", "backend", "debug_counters", "recorder",
+                   "vaccine_penalty", "infected_neighbor_bonus", "adaptive", "event_log", "profile")
+
+
+def take_snapshot(model):
+    """Copy the full state of model into a snapshot dict {"meta": ..., "arrays": ...}."""
+    population, profiler = model.population, model.profiler
+    n = population.size
+    arrays = {name: getattr(population, name)[:n].copy() for name in ARRAY_FIELDS}
+    arrays["critical_delay"] = np.array([person.critical_delay for person in model.people], dtype=np.int32)
+    arrays["infected_timer"] = np.array([person.infected_timer for person in model.people], dtype=np.int32)
+    arrays["passable"] = model.passable.copy()
+
+    version, internal_state, gauss = model.random.getstate()
+    meta = {
+        "width": model.grid.width,
+        "height": model.grid.height,
+        "batched_moves": model.batched_moves,
+        # None for engine objects outside ENGINES (e.g. an InferenceClient): restore needs backend=
+        "backend": engine_name(model.backend),
+        "debug_counters": model.debug_counters,
+        "vaccine_penalty": model.vaccine_penalty,
+        "infected_neighbor_bonus": model.infected_neighbor_bonus,
+        "profile": model.profiler.enabled,
+        # Hospitals in schedule order, so the activation order is reproduced on restore
+        "hospitals": [list(agent.pos) for agent in model.schedule.agents if isinstance(agent, Hospital)],
+        "head": population.head,
+        "length": population.length,
+        "steps": model.schedule.steps,
+        "time": model.schedule.time,
+        "running": getattr(model, "running", True),
+        "random_state": [version, list(internal_state), gauss],
+        "np_random_state": model.np_random.bit_generator.state,
+        "model_vars": {name: list(values) for name, values in model.datacollector.model_vars.items()},
+        "events": dict(model.events),
+        "profiler": {"steps": profiler.steps, "last": dict(profiler.last), "previous": dict(profiler.previous),
+                     "totals": dict(profiler.totals)},
+    }
+    return {"meta": meta, "arrays": arrays}
+
+
+def save_snapshot(snapshot, path):
+    os.makedirs(path, exist_ok=True)
+    for name, values in snapshot["arrays"].items():
+        np.save(os.path.join(path, name + ".npy"), values)
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump(snapshot["meta"], f, default=json_default)
+
+
+def load_snapshot(path, mmap=True):
+    """Load a saved snapshot; with mmap=True its arrays are copy-on-write memory maps."""
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    arrays = {}
+    for file_name in os.listdir(path):
+        if file_name.endswith(".npy"):
+            arrays[file_name[:-4]] = np.load(os.path.join(path, file_name), mmap_mode="c" if mmap else None)
+    return {"meta": meta, "arrays": arrays, "path": path}
+
+
+def restore(snapshot, add_hospitals=(), copy=False, **overrides):
+    """Build a PandemicModel that continues from snapshot.
+
+    add_hospitals places extra hospitals at the given cells, and overrides (any of
+    MODEL_OVERRIDES) replace the snapshot's model arguments. Unless copy is True the
+    model works directly on the snapshot arrays, so a snapshot should be restored at most
+    once that way; fork() takes care of this for many branches.
+    """
+    unknown = set(overrides) - set(MODEL_OVERRIDES)
+    if unknown:
+        raise TypeError(f"cannot override {sorted(unknown)} when restoring a snapshot")
+    meta = snapshot["meta"]
+    arrays = snapshot["arrays"]
+    if copy:
+        arrays = {name: np.array(values) for name, values in arrays.items()}
+    params = {name: meta[name] for name in MODEL_OVERRIDES if name in meta}
+    params.update(overrides)
+    if params.get("backend") is None:
+        raise ValueError("the snapshot was taken with an engine object, pass backend= to restore it")
+
+    # An empty model provides the grid, walls and schedule; everything else is put back below.
+    model = PandemicModel(meta["width"], meta["height"], 0, num_hospitals=0, **params)
+    model.passable = arrays["passable"]
+    for i, pos in enumerate(list(meta["hospitals"]) + [list(pos) for pos in add_hospitals]):
+        hospital = Hospital(f"H{i}", model)
+        model.grid.place_agent(hospital, tuple(pos))
+        model.schedule.add(hospital)
+        model.hospital_cells[tuple(pos)] = True
+
+    model.population = PopulationStore.from_arrays(arrays, meta["head"], meta["length"])
+    for row in range(model.population.size):
+        person = Person.from_row(model, row, int(arrays["critical_delay"][row]), int(arrays["infected_timer"][row]))
+        model.people.append(person)
+        model.grid.place_agent(person, tuple(int(v) for v in arrays["pos"][row]))
+        model.schedule.add(person)
+
+    version, internal_state, gauss = meta["random_state"]
+    model.random.setstate((version, tuple(internal_state), gauss))
+    model.np_random.bit_generator.state = meta["np_random_state"]
+    model.schedule.steps = meta["steps"]
+    model.schedule.time = meta["time"]
+    model.running = meta["running"]
+    # The new model's DataCollector has the reporters of its arguments (profile adds the
+    # seconds_* columns): stored series of other reporters are dropped, missing ones padded.
+    collected = len(next(iter(meta["model_vars"].values()), []))
+    for name in model.datacollector.model_vars:
+        model.datacollector.model_vars[name] = list(meta["model_vars"].get(name, [None] * collected))
+    model.events.update(meta.get("events", {}))
+    # Timers continue from the snapshot (they only advance if the restored model profiles)
+    profiler = meta.get("profiler", {})
+    model.profiler.steps = profiler.get("steps", 0)
+    for name in ("last", "previous", "totals"):
+        getattr(model.profiler, name).update(profiler.get(name, {}))
+    return model
+
+
+def fork(snapshot, branches):
+    """Restore one model per branch, where each branch is a dict of restore() keyword arguments.
+
+    In-memory snapshots are copied per branch. Snapshots from load_snapshot() are mapped
+    again for every branch: each branch gets its own copy-on-write mapping of the same
+    files, so pages a branch has not written stay shared between branches.
+    """
+    if snapshot.get("path") is not None:
+        return [restore(load_snapshot(snapshot["path"]), **branch) for branch in branches]
+    return [restore(snapshot, copy=True, **branch) for branch in branches]
+
+
+def json_default(value):
+    # Reporters, portrayals and snapshot metadata may hold NumPy scalars
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
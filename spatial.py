@@ -0,0 +1,63 @@
+import numpy as np
+
+# Offsets of the 8 cells in a Moore neighbourhood, centre excluded.
+MOORE_OFFSETS = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx != 0 or dy != 0]
+
+
+def moore_sum(counts):
+    """Sum of the 8 surrounding cells of every cell of a (width, height) array.
+
+    Cells outside the grid count as zero, matching a non-toroidal MultiGrid.
+    """
+    width, height = counts.shape
+    padded = np.pad(counts, 1)
+    total = np.zeros_like(counts)
+    for dx, dy in MOORE_OFFSETS:
+        total += padded[1 + dx:1 + dx + width, 1 + dy:1 + dy + height]
+    return total
+
+
+def occupancy(width, height, pos, mask=None):
+    """Number of agents per cell, optionally restricted to agents where mask is True."""
+    on_grid = pos[:, 0] >= 0
+    if mask is not None:
+        on_grid &= mask
+    cells = pos[on_grid, 0] * height + pos[on_grid, 1]
+    return np.bincount(cells, minlength=width * height).reshape(width, height)
+
+
+def count_infected_neighbors(width, height, pos, infected):
+    """Infected agents around every agent, for all agents at once.
+
+    Gives the same counts as MultiGrid.get_neighbors(pos, moore=True, include_center=False)
+    filtered on infected agents: the agent's own cell (and so the agent itself) is excluded.
+    pos is an (n, 2) array of grid positions, infected an (n,) boolean mask.
+    """
+    counts = moore_sum(occupancy(width, height, pos, infected))
+    result = np.zeros(len(pos), dtype=counts.dtype)
+    on_grid = pos[:, 0] >= 0
+    result[on_grid] = counts[pos[on_grid, 0], pos[on_grid, 1]]
+    return result
+
+
+def legal_moves(passable, pos):
+    """(n, 8) mask of the Moore moves, in MOORE_OFFSETS order, that stay on passable cells."""
+    padded = np.pad(passable, 1, constant_values=False)
+    x, y = pos[:, 0] + 1, pos[:, 1] + 1
+    return np.stack([padded[x + dx, y + dy] for dx, dy in MOORE_OFFSETS], axis=1)
+
+
+def random_moves(passable, pos, rng):
+    """New positions after every agent takes one uniformly chosen legal Moore step.
+
+    Agents without a legal move stay where they are.
+    """
+    legal = legal_moves(passable, pos)
+    n_legal = legal.sum(axis=1)
+    # Pick the k-th legal move of every row: the first column whose running count exceeds k.
+    k = np.floor(rng.random(len(pos)) * n_legal).astype(np.intp)
+    move = (np.cumsum(legal, axis=1) <= k[:, None]).sum(axis=1)
+    can_move = n_legal > 0
+    new_pos = pos.copy()
+    new_pos[can_move] += np.array(MOORE_OFFSETS, dtype=pos.dtype)[move[can_move]]
+    return new_pos
@@ -0,0 +1,98 @@
+"""Tests of the event log and its contact-tracing index on seeded and hand-built runs."""
+import numpy as np
+
+from eventlog import INFECTION, EventIndex, EventLog, read_events
+from pandemic_model import INFECTED, PandemicModel
+from population import STATE_CODES
+from spatial import count_infected_neighbors
+
+
+class CheckedEventLog(EventLog):
+    """An EventLog that also keeps the spatial counts and infected neighbours of every infection."""
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.expected = {}   # (step, unique_id) -> (count, set of infected neighbour ids)
+
+    def state_changes(self, model, rows, new_states):
+        population = model.population
+        size = population.size
+        pos, infected = population.pos[:size], population.state[:size] == INFECTED
+        counts = count_infected_neighbors(model.grid.width, model.grid.height, pos, infected)
+        for row in rows[(new_states == INFECTED) & (population.state[rows] != INFECTED)]:
+            near = infected & (np.abs(pos - pos[row]).max(axis=1) == 1)
+            self.expected[model.schedule.steps, population.unique_id[row]] = (
+                counts[row], set(population.unique_id[:size][near].tolist()))
+        super().state_changes(model, rows, new_states)
+
+
+def logged_run(directory, steps=30):
+    with CheckedEventLog(directory) as log:
+        model = PandemicModel(20, 20, 80, backend="numpy", seed=11, event_log=log)
+        for _ in range(steps):
+            model.step()
+    return log, model
+
+
+def test_steps_are_monotonic(tmp_path):
+    logged_run(tmp_path)
+    records, _ = read_events(tmp_path)
+    assert len(records) and (np.diff(records["step"]) >= 0).all()
+    assert records["step"].min() >= 1
+
+    index = EventIndex(tmp_path)
+    for agent in np.unique(records["agent"]):
+        events = index.events(agent)
+        assert len(events) == np.count_nonzero(records["agent"] == agent)
+        assert (np.diff(events["step"]) >= 0).all()
+        # Step ranges select exactly the events inside them
+        assert len(index.events(agent, start=10, stop=20)) == np.count_nonzero(
+            (events["step"] >= 10) & (events["step"] < 20))
+        assert (np.diff(index.contacts(agent)["step"]) >= 0).all()
+
+
+def test_contacts_match_spatial_counts(tmp_path):
+    log, _ = logged_run(tmp_path)
+    records, _ = read_events(tmp_path)
+    index = EventIndex(tmp_path)
+    infections = records[records["type"] == INFECTION]
+    assert len(infections) == len(log.expected) and infections["contacts_count"].max() > 1
+    for record in infections:
+        count, sources = log.expected[record["step"], record["agent"]]
+        assert record["contacts_count"] == count
+        contacts = index.event_contacts(record)
+        assert len(contacts) == count and set(contacts.tolist()) == sources
+
+
+def test_known_transmission_chain(tmp_path):
+    model = PandemicModel(20, 20, 4, backend="numpy", seed=0)
+    population = model.population
+    a, b, c, d = range(4)
+    ids = population.unique_id[:4].tolist()
+    for row, cell in zip((a, b, c, d), [(2, 2), (3, 3), (15, 15), (16, 16)]):
+        model.grid.move_agent(model.people[row], cell)
+    population.set_states(np.arange(4), STATE_CODES["healthy"])
+    population.set_states([a], INFECTED)
+
+    with EventLog(tmp_path) as log:
+        # Step 1: b, next to a, is infected; d, far from everyone, too (no contacts).
+        model.schedule.steps = 1
+        log.state_changes(model, np.array([b, d]), np.array([INFECTED, INFECTED], dtype=np.int8))
+        population.set_states([b, d], INFECTED)
+        # Step 2: c moves next to b (but not to a) and is infected.
+        model.grid.move_agent(model.people[c], (4, 4))
+        model.schedule.steps = 2
+        log.state_changes(model, np.array([c]), np.array([INFECTED], dtype=np.int8))
+        population.set_states([c], INFECTED)
+
+    index = EventIndex(tmp_path)
+    assert index.transmission_chain(ids[c]) == [
+        {"agent": ids[c], "step": 2, "sources": [ids[b]]},
+        {"agent": ids[b], "step": 1, "sources": [ids[a]]},
+    ]
+    assert index.transmission_chain(ids[d]) == [{"agent": ids[d], "step": 1, "sources": []}]
+    assert index.transmission_chain(ids[c], step=2) == []   # no infection of c before step 2
+    assert index.transmission_chain(ids[c], max_depth=0) == [{"agent": ids[c], "step": 2, "sources": [ids[b]]}]
+    contacts = index.contacts(ids[b])
+    assert [(int(s), int(agent), str(direction)) for s, agent, direction in contacts] == [
+        (1, ids[a], "source"), (2, ids[c], "exposed")]
@@ -0,0 +1,14 @@
+"""Parity of the NumPy inference engine with the Keras models."""
+import pytest
+
+from export_weights import check_parity
+
+# Tolerance of export_weights.py
+TOLERANCE = 1e-4
+
+
+def test_numpy_engine_matches_keras():
+    pytest.importorskip("tensorflow")
+    state_diff, vitals_diff = check_parity()
+    assert state_diff <= TOLERANCE
+    assert vitals_diff <= TOLERANCE
@@ -0,0 +1,87 @@
+"""Seeded equivalence tests of the batched movement phase (PandemicModel.move_people)."""
+import numpy as np
+
+from pandemic_model import CRITICAL, PandemicModel
+from spatial import MOORE_OFFSETS, legal_moves, random_moves
+
+
+def person_move_candidates(model, person, monkeypatch):
+    """The cells Person.move chooses from, captured from its random.choice call."""
+    captured = []
+
+    def choice(candidates):
+        captured.extend(candidates)
+        return person.pos  # stay put
+
+    monkeypatch.setattr(model.random, "choice", choice)
+    person.move()
+    monkeypatch.undo()
+    return set(captured)
+
+
+def test_legal_moves_match_person_move(monkeypatch):
+    model = PandemicModel(20, 20, 60, backend="numpy", seed=1)
+    person = model.people[0]
+    # Walk one person over every passable cell: edges, corners, walls, gates and hospitals.
+    for x, y in zip(*np.nonzero(model.passable)):
+        model.grid.move_agent(person, (int(x), int(y)))
+        legal = legal_moves(model.passable, np.array([[x, y]]))[0]
+        expected = {(int(x) + dx, int(y) + dy) for (dx, dy), ok in zip(MOORE_OFFSETS, legal) if ok}
+        assert person_move_candidates(model, person, monkeypatch) == expected, (x, y)
+
+
+def test_random_moves_uniform_over_legal_moves():
+    passable = np.ones((10, 10), dtype=bool)
+    passable[4, :] = False                 # a wall next to (5, y)
+    rng = np.random.default_rng(0)
+    samples = 40_000
+    # 99.9% quantiles of the chi-square distribution with len(legal) - 1 degrees of freedom
+    critical = {2: 13.82, 4: 18.47, 7: 24.32}
+    for start in [(0, 0), (5, 5), (7, 7)]:   # corner (3 moves), beside the wall (5), open (8)
+        pos = np.tile(np.array(start), (samples, 1))
+        legal = legal_moves(passable, pos[:1])[0]
+        moved = random_moves(passable, pos, rng) - np.array(start)
+        counts = {offset: 0 for offset, ok in zip(MOORE_OFFSETS, legal) if ok}
+        for offset in map(tuple, moved):
+            assert offset in counts, (start, offset)
+            counts[offset] += 1
+        expected = samples / len(counts)
+        chi2 = sum((count - expected) ** 2 / expected for count in counts.values())
+        assert chi2 < critical[len(counts) - 1], (start, counts)
+
+
+def test_random_moves_stay_without_legal_moves():
+    passable = np.zeros((3, 3), dtype=bool)
+    passable[1, 1] = True
+    pos = np.array([[1, 1]])
+    assert (random_moves(passable, pos, np.random.default_rng(0)) == pos).all()
+
+
+def test_batched_moves_match_agent_steps():
+    """Vaccination and critical_steps of both move paths agree for identical positions."""
+    batched = PandemicModel(20, 20, 60, batched_moves=True, backend="numpy", seed=2)
+    stepped = PandemicModel(20, 20, 60, batched_moves=False, backend="numpy", seed=2)
+    rng = np.random.default_rng(2)
+    hospitals = np.argwhere(batched.hospital_cells)
+    states = np.zeros(60, dtype=np.int8)
+    longest_critical = 0
+    for _ in range(10):
+        # Same states for both, with some people critical (a fifth redrawn per round, so
+        # critical streaks build up) and some standing on hospitals.
+        redraw = rng.random(60) < 0.2
+        states[redraw] = rng.choice([0, 1, CRITICAL, 3], size=redraw.sum(), p=[0.4, 0.2, 0.3, 0.1])
+        batched.population.set_states(np.arange(60), states)
+        stepped.population.set_states(np.arange(60), states)
+        for row in rng.choice(60, size=6, replace=False):
+            x, y = hospitals[rng.integers(len(hospitals))]
+            batched.grid.move_agent(batched.people[row], (int(x), int(y)))
+        for person, twin in zip(batched.people, stepped.people):
+            stepped.grid.move_agent(twin, person.pos)
+
+        batched.move_people()
+        stepped.schedule.step()
+        for name in ("vaccinated", "critical_steps"):
+            np.testing.assert_array_equal(getattr(batched.population, name), getattr(stepped.population, name))
+        assert batched.population.vaccinated_count == stepped.population.vaccinated_count
+        longest_critical = max(longest_critical, batched.population.critical_steps.max())
+    assert batched.population.vaccinated.any() and longest_critical > 1
@@ -0,0 +1,29 @@
+"""Seeded runs of PandemicModel with the live counters checked against full scans."""
+import numpy as np
+import pytest
+
+from pandemic_model import COUNTER_REPORTERS, CRITICAL, PandemicModel
+
+
+@pytest.mark.parametrize("batched_moves", [True, False])
+def test_counters_match_full_scans(batched_moves):
+    model = PandemicModel(20, 20, 120, backend="numpy", seed=7, batched_moves=batched_moves, debug_counters=True)
+    rng = np.random.default_rng(7)
+    population = model.population
+    for step in range(60):
+        # Natural deaths are rare, so every ten steps three live people are held critical
+        # until their critical streak kills them.
+        if step % 10 == 0:
+            held = rng.choice(population.live_rows(), size=3, replace=False)
+        alive = held[~population.dead[held]]
+        population.set_states(alive, CRITICAL)
+        model.step()   # raises if a counter disagrees with the full scan
+    assert population.dead_count >= 10 and population.vaccinated_count > 0
+    assert model.events["death"] == population.dead_count
+    assert model.events["vaccination"] == population.vaccinated_count
+
+    population.state_counts[0] += 1
+    with pytest.raises(RuntimeError, match="Healthy counter"):
+        model.check_counters()
+    frame = model.datacollector.get_model_vars_dataframe()
+    assert list(frame.columns) == list(COUNTER_REPORTERS) and len(frame) == 60
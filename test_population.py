@@ -0,0 +1,162 @@
+"""Unit tests of PopulationStore against plain per-agent vitals lists."""
+import numpy as np
+import pytest
+
+from population import ARRAY_FIELDS, CRITICAL, INFECTED, NUM_VITALS, STATE_NAMES, PopulationStore
+
+
+def make_store(n=5, history_length=4, initial=2, capacity=None, seed=0):
+    """A store of n agents and the per-agent vitals lists it should match."""
+    rng = np.random.default_rng(seed)
+    store = PopulationStore(capacity or n, history_length)
+    histories = []
+    for i in range(n):
+        history = rng.normal(size=(initial, NUM_VITALS)).astype(np.float32)
+        assert store.add(100 + i, "healthy", history) == i
+        histories.append(list(history))
+    return store, histories
+
+
+def assert_matches(store, histories):
+    expected = np.array([history[-store.history_length:] for history in histories])
+    np.testing.assert_array_equal(store.history_window(), expected)
+    np.testing.assert_array_equal(store.latest(), expected[:, -1])
+    for row, history in enumerate(expected):
+        np.testing.assert_array_equal(store.agent_history(row), history)
+
+
+def test_add_keeps_the_initial_history():
+    store, histories = make_store()
+    assert (store.size, store.length, store.head) == (5, 2, 1)
+    assert_matches(store, histories)
+    with pytest.raises(ValueError):
+        store.add(0, "healthy", np.zeros((3, NUM_VITALS)))   # a different history length
+    store, _ = make_store(n=2, capacity=2)
+    with pytest.raises(ValueError):
+        store.add(0, "healthy", np.zeros((2, NUM_VITALS)))   # full
+
+
+def test_push_wraps_around_the_ring_in_order():
+    store, histories = make_store()
+    rng = np.random.default_rng(1)
+    heads = []
+    # Several times history_length pushes, each for a random subset of the rows
+    for _ in range(3 * store.history_length + 1):
+        rows = np.flatnonzero(rng.random(store.size) < 0.6)
+        values = rng.normal(size=(len(rows), NUM_VITALS)).astype(np.float32)
+        store.push(rows, values)
+        updated = dict(zip(rows, values))
+        for row, history in enumerate(histories):
+            history.append(updated.get(row, history[-1]))   # rows not pushed carry their vitals forward
+        heads.append(store.head)
+        assert store.length == min(len(histories[0]), store.history_length)
+        assert_matches(store, histories)
+    assert sorted(set(heads)) == list(range(store.history_length))
+
+
+def test_history_window_is_a_view_oldest_first():
+    store, _ = make_store()
+    for step in range(6):
+        store.push(np.arange(store.size), np.full((store.size, NUM_VITALS), step, dtype=np.float32))
+    window = store.history_window()
+    assert window.base is not None and np.shares_memory(window, store.vitals)
+    np.testing.assert_array_equal(window[:, :, 0], np.tile([2, 3, 4, 5], (store.size, 1)))
+
+
+def test_set_latest_overwrites_only_the_newest_entry():
+    store, histories = make_store()
+    for _ in range(5):   # past the end of the ring, so both copies of the head are in use
+        store.push(np.arange(store.size), np.ones((store.size, NUM_VITALS), dtype=np.float32))
+        for history in histories:
+            history.append(np.ones(NUM_VITALS, dtype=np.float32))
+    rows = np.array([1, 3])
+    store.set_latest(rows, np.full((2, NUM_VITALS), 7, dtype=np.float32))
+    for row in rows:
+        histories[row][-1] = np.full(NUM_VITALS, 7, dtype=np.float32)
+    assert_matches(store, histories)
+
+    store.push([0], np.zeros((1, NUM_VITALS), dtype=np.float32))   # the overwrite carries forward
+    np.testing.assert_array_equal(store.latest()[rows], 7)
+
+
+def test_counters_follow_setters():
+    store, _ = make_store()
+    store.set_states([0, 1, 2], [INFECTED, CRITICAL, INFECTED])
+    store.set_states(2, CRITICAL)
+    assert store.set_vaccinated([0, 1]).tolist() == [0, 1]
+    assert store.set_vaccinated([1, 4]).tolist() == [4]       # only rows that change are returned
+    assert store.set_dead([3]).tolist() == [3]
+    assert store.set_dead([3], False).tolist() == [3]
+    state_counts, vaccinated_count, dead_count = store.scan_counts()
+    np.testing.assert_array_equal(store.state_counts, state_counts)
+    assert dict(zip(STATE_NAMES, store.state_counts.tolist())) == {
+        "healthy": 2, "infected": 1, "critical": 2, "chronic": 0, "dead": 0}
+    assert (store.vaccinated_count, store.dead_count) == (vaccinated_count, dead_count) == (3, 0)
+    np.testing.assert_array_equal(store.live_rows(), np.arange(5))
+    store.set_dead([0, 2])
+    np.testing.assert_array_equal(store.live_rows(), [1, 3, 4])
+
+
+def test_copy_and_from_arrays():
+    store, histories = make_store(n=4, capacity=10)
+    for step in range(7):
+        store.push(np.arange(4), np.full((4, NUM_VITALS), step, dtype=np.float32))
+        for history in histories:
+            history.append(np.full(NUM_VITALS, step, dtype=np.float32))
+    store.set_states([1], INFECTED)
+    store.set_vaccinated([2])
+    store.set_dead([3])
+    store.pos[:4] = [[0, 1], [2, 3], [4, 5], [-1, -1]]
+
+    copy = store.copy()
+    assert (copy.size, copy.capacity, copy.head, copy.length) == (4, 4, store.head, store.length)
+    for name in ARRAY_FIELDS[:-1]:   # all but vitals
+        np.testing.assert_array_equal(getattr(copy, name), getattr(store, name)[:4])
+    np.testing.assert_array_equal(copy.state_counts, store.state_counts)
+    assert (copy.vaccinated_count, copy.dead_count) == (1, 1)
+    assert_matches(copy, histories)
+
+    # The copy is independent of the original
+    copy.push(np.arange(4), np.zeros((4, NUM_VITALS), dtype=np.float32))
+    copy.set_states([0], CRITICAL)
+    assert_matches(store, histories)
+    assert store.state[0] == 0
+
+    # from_arrays wraps the arrays it is given and recounts the counters
+    arrays = {name: getattr(copy, name) for name in ARRAY_FIELDS}
+    wrapped = PopulationStore.from_arrays(arrays, copy.head, copy.length)
+    assert wrapped.vitals is copy.vitals and wrapped.history_length == store.history_length
+    np.testing.assert_array_equal(wrapped.state_counts, copy.state_counts)
+    np.testing.assert_array_equal(wrapped.history_window(), copy.history_window())
+
+
+def test_remove_and_extend_in_place():
+    store, histories = make_store(n=8)
+    for step in range(3):
+        store.push(np.arange(8), np.full((8, NUM_VITALS), step, dtype=np.float32))
+        for history in histories:
+            history.append(np.full(NUM_VITALS, step, dtype=np.float32))
+    store.set_states([1, 6], INFECTED)
+    store.set_vaccinated([2, 7])
+    store.set_dead([6])
+
+    leaving = np.array([1, 6, 2])
+    taken = store.take(leaving)
+    vitals = store.vitals
+    moved_from, moved_to = store.remove(leaving)
+    # Only the rows of the leaving agents are filled, from the end of the store
+    assert moved_from.tolist() == [5, 7] and moved_to.tolist() == [1, 2] and store.vitals is vitals
+    kept = [0, 5, 7, 3, 4]
+    np.testing.assert_array_equal(store.unique_id[:store.size], [100 + row for row in kept])
+    assert_matches(store, [histories[row] for row in kept])
+    assert (store.vaccinated_count, store.dead_count) == (1, 0)
+
+    rows = store.extend(taken)   # past the capacity of 8, so the arrays grow
+    assert rows.tolist() == [5, 6, 7] and store.capacity >= 8
+    np.testing.assert_array_equal(store.unique_id[:store.size], [100 + row for row in kept + leaving.tolist()])
+    assert_matches(store, [histories[row] for row in kept + leaving.tolist()])
+    state_counts, vaccinated_count, dead_count = store.scan_counts()
+    np.testing.assert_array_equal(store.state_counts, state_counts)
+    assert (store.vaccinated_count, store.dead_count) == (vaccinated_count, dead_count) == (2, 1)
+    store.extend(store.take([0]))
+    assert store.size == 9 and store.capacity == 12
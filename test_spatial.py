@@ -0,0 +1,56 @@
+"""Seeded equivalence tests of spatial.count_infected_neighbors against per-agent Moore scans."""
+import numpy as np
+from mesa import Agent, Model
+from mesa.space import MultiGrid
+
+from pandemic_model import CRITICAL, INFECTED, Hospital, PandemicModel
+from spatial import count_infected_neighbors
+
+
+def moore_scan(grid, agent, infected):
+    """Infected people around one agent, the way the per-agent Person code counted them."""
+    neighbors = grid.get_neighbors(agent.pos, moore=True, include_center=False)
+    return sum(1 for neighbor in neighbors if neighbor in infected)
+
+
+def test_counts_match_moore_scan_on_random_grids():
+    rng = np.random.default_rng(3)
+    model = Model()
+    for trial in range(50):
+        width, height = (int(side) for side in rng.integers(1, 12, size=2))
+        n = int(rng.integers(1, 3 * width * height))
+        pos = np.stack([rng.integers(width, size=n), rng.integers(height, size=n)], axis=1)
+        # Up to three agents per cell on average, and always some on the corners
+        pos[:4] = [(0, 0), (width - 1, height - 1), (0, height - 1), (width - 1, 0)][:n]
+        off_grid = rng.random(n) < 0.1          # dead people removed from the grid
+        pos[off_grid] = -1
+        is_infected = rng.random(n) < 0.4
+
+        grid = MultiGrid(width, height, torus=False)
+        agents = [Agent(i, model) for i in range(n)]
+        for agent, (x, y) in zip(agents, pos):
+            if x >= 0:
+                grid.place_agent(agent, (int(x), int(y)))
+        # Hospitals share cells with people and never count as infected
+        for i, cell in enumerate(rng.integers(width * height, size=3)):
+            grid.place_agent(Hospital(f"H{i}", model), (int(cell // height), int(cell % height)))
+        infected = {agent for agent, flag, gone in zip(agents, is_infected, off_grid) if flag and not gone}
+
+        counts = count_infected_neighbors(width, height, pos, is_infected)
+        expected = [0 if agent.pos is None else moore_scan(grid, agent, infected) for agent in agents]
+        np.testing.assert_array_equal(counts, expected, err_msg=f"trial {trial}: {width}x{height}, {n} agents")
+
+
+def test_model_counts_match_moore_scan():
+    model = PandemicModel(20, 20, 200, backend="numpy", seed=4)
+    rng = np.random.default_rng(4)
+    hospitals = np.argwhere(model.hospital_cells)
+    for _ in range(5):
+        model.population.set_states(np.arange(200), rng.choice([0, INFECTED, CRITICAL, 3], size=200))
+        for row in rng.choice(200, size=20, replace=False):
+            x, y = hospitals[rng.integers(len(hospitals))]
+            model.grid.move_agent(model.people[row], (int(x), int(y)))
+        infected = {person for person in model.people if person.state == "infected"}
+        expected = [moore_scan(model.grid, person, infected) for person in model.people]
+        assert max(expected) > 1
+        np.testing.assert_array_equal(model.infected_neighbor_counts(), expected)
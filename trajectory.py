@@ -0,0 +1,126 @@
+"""Per-agent trajectory recording to chunked .npz files.
+
+A TrajectoryRecorder attached to a PandemicModel writes one row per person per step
+(unique_id, position, state, vaccinated, dead and the four latest vitals) into
+fixed-size column buffers, and writes each full buffer to <directory>/chunk-NNNNN.npz.
+Memory use is bounded by chunk_rows, however long the run is.
+
+    with TrajectoryRecorder("runs/baseline") as recorder:
+        model = PandemicModel(20, 20, 30, recorder=recorder)
+        for _ in range(1000):
+            model.step()
+
+    for chunk in read_trajectory("runs/baseline", columns=["step", "unique_id", "state"]):
+        ...
+"""
+import json
+import os
+
+import numpy as np
+
+from population import STATE_NAMES
+
+COLUMNS = {
+    "step": np.int32,
+    "unique_id": np.int64,
+    "x": np.int32,
+    "y": np.int32,
+    "state": np.int8,  # index into population.STATE_NAMES
+    "vaccinated": np.bool_,
+    "dead": np.bool_,
+    "blood_pressure": np.float32,
+    "temperature": np.float32,
+    "respiratory_rate": np.float32,
+    "heart_rate": np.float32,
+}
+VITALS_COLUMNS = ("blood_pressure", "temperature", "respiratory_rate", "heart_rate")
+MANIFEST = "manifest.json"
+
+
+class TrajectoryRecorder:
+    """Streams per-step, per-agent rows of a PandemicModel to chunked .npz files."""
+
+    def __init__(self, directory, chunk_rows=1_000_000, compress=False):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self.compress = compress
+        self.buffers = {name: np.empty(chunk_rows, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.fill = 0
+        self.chunks = []
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, model):
+        """Append the current row of every person of model."""
+        population = model.population
+        n = population.size
+        vitals = population.latest()
+        columns = {
+            "step": np.full(n, model.schedule.steps, dtype=np.int32),
+            "unique_id": population.unique_id[:n],
+            "x": population.pos[:n, 0],
+            "y": population.pos[:n, 1],
+            "state": population.state[:n],
+            "vaccinated": population.vaccinated[:n],
+            "dead": population.dead[:n],
+        }
+        for i, name in enumerate(VITALS_COLUMNS):
+            columns[name] = vitals[:, i]
+
+        start = 0
+        while start < n:
+            count = min(n - start, self.chunk_rows - self.fill)
+            for name, values in columns.items():
+                self.buffers[name][self.fill:self.fill + count] = values[start:start + count]
+            self.fill += count
+            start += count
+            if self.fill == self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        if self.fill == 0:
+            return
+        name = f"chunk-{len(self.chunks):05d}.npz"
+        save = np.savez_compressed if self.compress else np.savez
+        save(os.path.join(self.directory, name), **{key: values[:self.fill] for key, values in self.buffers.items()})
+        self.chunks.append({"file": name, "rows": self.fill})
+        self.rows += self.fill
+        self.fill = 0
+        self._write_manifest()
+
+    def close(self):
+        self.flush()
+        self._write_manifest()
+
+    def _write_manifest(self):
+        manifest = {
+            "columns": {name: np.dtype(dtype).str for name, dtype in COLUMNS.items()},
+            "states": list(STATE_NAMES),
+            "rows": self.rows,
+            "chunks": self.chunks,
+        }
+        with open(os.path.join(self.directory, MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=1)
+
+
+def read_trajectory(directory, columns=None):
+    """Yield each chunk of a recorded trajectory as a dict of column arrays."""
+    with open(os.path.join(directory, MANIFEST)) as f:
+        manifest = json.load(f)
+    for chunk in manifest["chunks"]:
+        with np.load(os.path.join(directory, chunk["file"])) as data:
+            yield {name: data[name] for name in (columns or data.files)}
+
+
+def load_trajectory(directory, columns=None):
+    """Load a whole trajectory into memory, one concatenated array per column."""
+    chunks = list(read_trajectory(directory, columns))
+    if not chunks:
+        return {name: np.empty(0, dtype=COLUMNS[name]) for name in (columns or COLUMNS)}
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}